@@ -0,0 +1,156 @@
+import random
+import string
+
+
+def random_words(n_words: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < n_words:
+        words.add("".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))))
+    return list(sorted(words))
+
+
+def random_names(n_names: int, n_words: int, seed: int = 0) -> list[str]:
+    "Generates camelCase identifiers built from a vocabulary of `n_words` words."
+    rng = random.Random(seed)
+    words = random_words(n_words, seed)
+    names = []
+    for _ in range(n_names):
+        parts = rng.choices(words, k=rng.randint(1, 4))
+        names.append(parts[0] + "".join(p.capitalize() for p in parts[1:]))
+    return names
+
+
+def random_dataset(n_members: int, n_clients: int = 10, n_deps: int | None = None, seed: int = 0):
+    "Generates a `Dataset` for a god file with `n_members` members and mostly acyclic dependencies."
+    import pandas as pd
+
+    from filesplitter.loading import Dataset
+
+    rng = random.Random(seed)
+    n_deps = 2 * n_members if n_deps is None else n_deps
+    top_id = 1
+    member_ids = list(range(top_id + 1, top_id + 1 + n_members))
+    kinds = rng.choices(["method", "field", "constructor"], weights=[6, 3, 1], k=n_members)
+    targets_df = pd.DataFrame(
+        {
+            "parent_id": top_id,
+            "name": random_names(n_members, max(n_members // 4, 8), seed),
+            "kind": kinds,
+            "start_row": range(n_members),
+            "end_row": range(1, n_members + 1),
+        },
+        index=pd.Index(member_ids, name="id"),
+    )
+    deps = set()
+    while len(deps) < n_deps:
+        src, tgt = rng.sample(member_ids, 2)
+        # Mostly point "down" the file, but allow a few cycles
+        if src > tgt and rng.random() > 0.05:
+            src, tgt = tgt, src
+        deps.add((src, tgt))
+    target_deps_df = pd.DataFrame(list(sorted(deps)), columns=["src_id", "tgt_id"])
+    target_deps_df["kind"] = "call"
+    client_ids = list(range(member_ids[-1] + 1, member_ids[-1] + 1 + n_clients))
+    clients_df = pd.DataFrame(
+        {"parent_id": None, "name": [f"src/Client{i}.java" for i in range(n_clients)], "kind": "file"},
+        index=pd.Index(client_ids, name="id"),
+    )
+    client_deps = {(c, t) for c in client_ids for t in rng.sample(member_ids, min(3, n_members))}
+    client_deps_df = pd.DataFrame(list(sorted(client_deps)), columns=["src_id", "tgt_id"])
+    client_deps_df["kind"] = "call"
+    touches_df = pd.DataFrame(
+        {
+            "sha1": [f"{rng.getrandbits(40):010x}" for _ in range(n_members)],
+            "author_email": [f"dev{rng.randint(0, 9)}@example.com" for _ in range(n_members)],
+            "entity_id": member_ids,
+            "adds": 1,
+            "dels": 0,
+        }
+    )
+    return Dataset(targets_df, target_deps_df, clients_df, client_deps_df, [], touches_df)
+
+
+def random_bisection(n_nodes: int, density: float = 2.0, seed: int = 0):
+    """Generates the inputs of a bisection like the ones `cluster_dataset` solves: acyclic dependency edges
+    and undirected text edges between strong components, with unit node weights."""
+    rng = random.Random(seed)
+    di_edges, un_edges = set(), set()
+    while len(di_edges) < int(density * n_nodes * 0.7):
+        a, b = sorted(rng.sample(range(n_nodes), 2))
+        di_edges.add((a, b))
+    while len(un_edges) < int(density * n_nodes * 0.3):
+        a, b = sorted(rng.sample(range(n_nodes), 2))
+        un_edges.add((a, b))
+    node_weights = {i: 1 for i in range(n_nodes)}
+    edge_weights = {e: 512 for e in di_edges}
+    for e in un_edges:
+        edge_weights[e] = edge_weights.get(e, 0) + rng.randint(700, 2048)
+    return di_edges, un_edges, node_weights, edge_weights
+
+
+def random_database(
+    path: str, n_files: int, n_members: int = 30, n_snapshots: int = 4, n_commits: int = 200, seed: int = 0
+):
+    """Writes a SQLite database shaped like the ones the queries in `filesplitter.db` run on: files with one
+    class each, `n_snapshots` tagged commits (each with the presence and dependencies of every entity) and
+    random changes to members."""
+    import sqlite3
+
+    rng = random.Random(seed)
+    con = sqlite3.connect(path)
+    con.executescript(
+        """
+        CREATE TABLE entities (id INTEGER PRIMARY KEY, parent_id INTEGER, name TEXT, kind TEXT, disc TEXT);
+        CREATE TABLE commits (
+            id INTEGER PRIMARY KEY, sha1 TEXT, author_email TEXT, committer_email TEXT, committer_date INTEGER
+        );
+        CREATE TABLE refs (id INTEGER PRIMARY KEY, commit_id INTEGER, name TEXT);
+        CREATE TABLE presence (commit_id INTEGER, entity_id INTEGER, start_row INTEGER, end_row INTEGER);
+        CREATE TABLE changes (commit_id INTEGER, entity_id INTEGER, adds INTEGER, dels INTEGER);
+        CREATE TABLE deps (commit_id INTEGER, src_id INTEGER, tgt_id INTEGER, kind TEXT);
+        """
+    )
+    entities, members_by_file = [], []
+    names = random_names(n_members, max(n_members // 2, 8), seed)
+    for f in range(n_files):
+        file_id = len(entities) + 1
+        entities.append((file_id, None, f"src/main/pkg{f % 20}/File{f}.java", "file", None))
+        class_id = file_id + 1
+        entities.append((class_id, file_id, f"File{f}", "class", None))
+        member_ids = list(range(class_id + 1, class_id + 1 + rng.randint(n_members // 2, n_members)))
+        for i, member_id in enumerate(member_ids):
+            entities.append((member_id, class_id, names[i], rng.choice(["method", "field"]), None))
+        members_by_file.append((class_id, member_ids))
+    con.executemany("INSERT INTO entities VALUES (?, ?, ?, ?, ?)", entities)
+
+    emails = [f"dev{i}@example.com" for i in range(20)]
+    commits = [
+        (i, f"{rng.getrandbits(64):016x}", rng.choice(emails), rng.choice(emails), 1_600_000_000 + 3600 * i)
+        for i in range(1, n_commits + 1)
+    ]
+    con.executemany("INSERT INTO commits VALUES (?, ?, ?, ?, ?)", commits)
+    snapshots = [n_commits * (s + 1) // n_snapshots for s in range(n_snapshots)]
+    refs = [(s + 1, c, f"refs/tags/v{s}") for s, c in enumerate(snapshots[:-1])]
+    con.executemany("INSERT INTO refs VALUES (?, ?, ?)", refs + [(n_snapshots, snapshots[-1], "refs/heads/main")])
+
+    deps = set()
+    for class_id, member_ids in members_by_file:
+        for src in member_ids:
+            for tgt in rng.sample(member_ids, min(2, len(member_ids))):
+                deps.add((src, tgt))
+            # A few dependencies on other files (and their classes)
+            other_class_id, other_member_ids = rng.choice(members_by_file)
+            deps.add((src, rng.choice([other_class_id] + other_member_ids)))
+    for commit_id in snapshots:
+        rows = [(commit_id, e[0], 10 * i, 10 * i + rng.randint(1, 60)) for i, e in enumerate(entities)]
+        con.executemany("INSERT INTO presence VALUES (?, ?, ?, ?)", rows)
+        con.executemany("INSERT INTO deps VALUES (?, ?, ?, 'call')", [(commit_id, a, b) for a, b in deps if a != b])
+    changes = [
+        (rng.randint(1, n_commits), rng.choice(member_ids), rng.randint(0, 40), rng.randint(0, 40))
+        for _, member_ids in members_by_file
+        for _ in range(len(member_ids))
+    ]
+    con.executemany("INSERT INTO changes VALUES (?, ?, ?, ?)", changes)
+    con.commit()
+    con.close()
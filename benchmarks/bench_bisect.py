@@ -0,0 +1,60 @@
+"""Checks the lean bisection model (`ilp.bisect`) against the generic one (`ilp.partition2`) on a corpus of
+random bisections: both must find the same optimal cut weight. Also compares how long they take to build and
+solve.
+
+Usage: python -m benchmarks.bench_bisect
+"""
+from math import ceil
+
+from benchmarks._synthetic import random_bisection
+from filesplitter import ilp
+from filesplitter.clustering import CUT_EPS
+
+MAX_TIME_IN_SECONDS = 30
+
+
+def corpus():
+    for n_nodes in [10, 20, 40, 60, 80]:
+        for seed in range(3):
+            di_edges, un_edges, node_weights, edge_weights = random_bisection(n_nodes, seed=seed)
+            yield f"{n_nodes}/{seed}", (di_edges, un_edges, node_weights, edge_weights)
+            # Without directed edges (where the parts are interchangeable)
+            yield f"{n_nodes}/{seed}/un", (set(), di_edges | un_edges, node_weights, edge_weights)
+
+
+def check(problem, labels):
+    "Returns whether the labels are balanced and respect the direction of the directed edges."
+    di_edges, _, node_weights, _ = problem
+    part_1 = sum(node_weights[i] for i, l in labels.items() if l == 1)
+    total = sum(node_weights[i] for i in labels)
+    bound = ceil((1 + CUT_EPS) * ceil(total / 2))
+    return max(part_1, total - part_1) <= bound and all(labels[a] <= labels[b] for a, b in di_edges if a != b)
+
+
+def main():
+    header = ["problem", "cut", "lean cut", "build (s)", "lean build (s)", "solve (s)", "lean solve (s)", "ok"]
+    print(" ".join(f"{h:>14}" for h in header))
+    totals = [0.0, 0.0, 0.0, 0.0]
+    mismatches = 0
+    for name, problem in corpus():
+        cut, _, stats = ilp.partition2(*problem, 2, CUT_EPS, MAX_TIME_IN_SECONDS)
+        lean_cut, labels, lean_stats = ilp.bisect(*problem, 2, CUT_EPS, MAX_TIME_IN_SECONDS)
+        times = [
+            stats.build_time,
+            lean_stats.build_time,
+            stats.wall_time - stats.build_time,
+            lean_stats.wall_time - lean_stats.build_time,
+        ]
+        totals = [a + b for a, b in zip(totals, times)]
+        # Only proven optima have to agree
+        both_optimal = stats.status == lean_stats.status == "optimal"
+        ok = (not both_optimal or cut == lean_cut) and (labels is None or check(problem, labels))
+        mismatches += not ok
+        row = [name, f"{cut:.0f}", f"{lean_cut:.0f}"] + [f"{t:.4f}" for t in times] + ["yes" if ok else "NO"]
+        print(" ".join(f"{x:>14}" for x in row))
+    print(" ".join(f"{x:>14}" for x in ["total", "", ""] + [f"{t:.4f}" for t in totals]))
+    print(f"{mismatches} mismatches (the solvers are limited to {MAX_TIME_IN_SECONDS} secs)")
+
+
+if __name__ == "__main__":
+    main()
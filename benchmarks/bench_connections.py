@@ -0,0 +1,57 @@
+"""Compares how long the fetch functions take on connections opened with different profiles (see
+`filesplitter.db.ConnectionProfile`): a plain `sqlite3.connect`, the default read-only one and an immutable one.
+
+Usage: python -m benchmarks.bench_connections [DB_PATH ...]
+
+Without paths, a random database is generated. Each profile is timed twice (cold and warm).
+"""
+import os
+import sys
+import tempfile
+from dataclasses import replace
+
+import pandas as pd
+
+from benchmarks._synthetic import random_database
+from filesplitter import db
+from filesplitter.index_advisor import prepare_fetches, sample_params, time_fetches
+
+PROFILES = {
+    "plain": db.PLAIN_PROFILE,
+    "read-only": db.ConnectionProfile(),
+    "immutable": replace(db.ConnectionProfile(), immutable=True),
+}
+
+
+def time_profile(db_path: str, profile: db.ConnectionProfile) -> dict[str, float]:
+    with db.connect(db_path, profile) as con:
+        db.reset_query_stats()
+        db.create_temp_tables(con)
+        params = sample_params(con)
+        prepare_fetches(con, params)
+        elapsed = time_fetches(con, params)
+        elapsed["_prelude"] = db.query_stats().loc["_prelude", "seconds"]
+    return elapsed
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_paths = sys.argv[1:]
+        if len(db_paths) == 0:
+            db_paths = [os.path.join(tmp_dir, "subject.db")]
+            random_database(db_paths[0], 3_000, seed=0)
+        for db_path in db_paths:
+            columns = {}
+            for name, profile in PROFILES.items():
+                for run in ["cold", "warm"]:
+                    columns[f"{name} ({run})"] = time_profile(db_path, profile)
+            report = pd.DataFrame(columns)
+            report.loc["total"] = report.sum()
+            print(f"{db_path} ({os.path.getsize(db_path) / 2**20:.0f} MiB)")
+            options = ["display.float_format", "{:.4f}".format, "display.width", 200, "display.max_columns", None]
+            with pd.option_context(*options):
+                print(report)
+
+
+if __name__ == "__main__":
+    main()
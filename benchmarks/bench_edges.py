@@ -0,0 +1,135 @@
+"""Compares the time and peak memory of each edge stage of `cluster_dataset` with sets of tuples (as it used to
+be) versus columnar edge arrays.
+
+Usage: python -m benchmarks.bench_edges
+"""
+import random
+import time
+import tracemalloc
+
+import numpy as np
+from ordered_set import OrderedSet as oset
+
+from benchmarks._synthetic import random_dataset
+from filesplitter.graph import Edges, group_by_scc, group_by_wcc, group_edges_by
+
+# The number of random active sets filtered per weakly connected component (like the recursion does)
+N_ACTIVE_SETS = 4
+
+
+def measure(f):
+    "Returns the result of f(), its wall time and its peak memory (in MiB)."
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = f()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 2**20
+
+
+def legacy_stages(ds, entities_df, txt_pairs, active_sets):
+    def build():
+        return oset((r["src_id"], r["tgt_id"]) for _, r in ds.deps_df().iterrows())
+
+    def grouping(edges):
+        strong_ids = group_by_scc(entities_df["name_id"], group_edges_by(edges, entities_df["name_id"]))
+        entities_df["strong_id"] = strong_ids
+        strong_edges = group_edges_by(edges, entities_df["strong_id"])
+        entities_df["weak_id"] = group_by_wcc(entities_df["strong_id"], strong_edges)
+        return strong_edges
+
+    def slicing(strong_edges):
+        roots = []
+        for weak_id in range(entities_df["weak_id"].max() + 1):
+            wcc_nodes = set(entities_df[entities_df["weak_id"] == weak_id]["strong_id"])
+            wcc_dep_edges = {(a, b) for a, b in strong_edges if a in wcc_nodes and b in wcc_nodes}
+            wcc_txt_edges = {(a, b) for a, b in txt_pairs if a in wcc_nodes and b in wcc_nodes}
+            roots.append((wcc_dep_edges, wcc_txt_edges, wcc_nodes))
+        return roots
+
+    def filtering(roots):
+        n_edges = 0
+        for (dep_edges, txt_edges, _), actives in zip(roots, active_sets):
+            for active in actives:
+                active_dep_edges = set((a, b) for a, b in dep_edges if a in active and b in active)
+                active_txt_edges = set((a, b) for a, b in txt_edges if a in active and b in active)
+                n_edges += len(active_dep_edges | active_txt_edges)
+        return n_edges
+
+    return [("build", build), ("grouping", grouping), ("slicing", slicing), ("filtering", filtering)]
+
+
+def columnar_stages(ds, entities_df, txt_pairs, active_sets):
+    def build():
+        return ds.dep_edges()
+
+    def grouping(edges):
+        entities_df["strong_id"] = group_by_scc(entities_df["name_id"], edges.relabel(entities_df["name_id"]))
+        strong_edges = edges.relabel(entities_df["strong_id"]).unique()
+        entities_df["weak_id"] = group_by_wcc(entities_df["strong_id"], strong_edges)
+        return strong_edges
+
+    def slicing(strong_edges):
+        dep_edges = Edges(strong_edges.src, strong_edges.tgt, np.full(len(strong_edges), "dep", dtype=object))
+        all_edges = Edges.concat([dep_edges, Edges.from_pairs(txt_pairs, "text")])
+        weak_edges = all_edges.relabel(entities_df.groupby("strong_id")["weak_id"].first())
+        inside = np.flatnonzero(weak_edges.src == weak_edges.tgt)
+        order = inside[np.argsort(weak_edges.src[inside], kind="stable")]
+        n_weak = entities_df["weak_id"].max() + 1
+        bounds = np.searchsorted(weak_edges.src[order], np.arange(n_weak + 1))
+        strong_ids_by_weak = entities_df.groupby("weak_id")["strong_id"].unique()
+        return [
+            (all_edges[order[bounds[w] : bounds[w + 1]]], set(strong_ids_by_weak[w].tolist())) for w in range(n_weak)
+        ]
+
+    def filtering(roots):
+        n_edges = 0
+        for (edges, _), actives in zip(roots, active_sets):
+            for active in actives:
+                n_edges += len(edges[edges.within(np.fromiter(active, dtype=np.int64))].unique())
+        return n_edges
+
+    return [("build", build), ("grouping", grouping), ("slicing", slicing), ("filtering", filtering)]
+
+
+def run(stages):
+    rows = []
+    result = None
+    for name, stage in stages:
+        result, elapsed, peak = measure(stage if result is None else lambda: stage(result))
+        rows.append((name, elapsed, peak))
+    return rows, result
+
+
+def main():
+    header = ["members", "deps", "stage", "legacy (s)", "legacy MiB", "columns (s)", "columns MiB"]
+    print(" ".join(f"{h:>11}" for h in header))
+    # Sparse dependencies give many small weakly connected components, dense ones give a few large ones
+    for n_members, n_deps in [(1_000, 1_000), (1_000, 3_000), (4_000, 4_000), (4_000, 12_000)]:
+        ds = random_dataset(n_members, n_deps=n_deps, seed=n_members)
+        entities_df = ds.entities_df()
+        entities_df["name_id"] = entities_df.groupby("name").ngroup()
+        rng = random.Random(n_members)
+
+        # Use the same strong ids (and thus the same text edges and random active sets) for both
+        legacy = legacy_stages(ds, entities_df, set(), [])
+        strong_edges = legacy[1][1](legacy[0][1]())
+        strong_ids = sorted(set(entities_df["strong_id"].tolist()))
+        txt_pairs = {tuple(sorted(rng.sample(strong_ids, 2))) for _ in range(n_members)}
+        roots = legacy_stages(ds, entities_df, txt_pairs, [])[2][1](strong_edges)
+        active_sets = [
+            [set(rng.sample(sorted(nodes), max(1, len(nodes) // 2))) for _ in range(N_ACTIVE_SETS)]
+            for _, _, nodes in roots
+        ]
+
+        legacy_rows, legacy_n = run(legacy_stages(ds, entities_df, txt_pairs, active_sets))
+        columns_rows, columns_n = run(columnar_stages(ds, entities_df, txt_pairs, active_sets))
+        assert legacy_n == columns_n
+        for (name, legacy_secs, legacy_mib), (_, columns_secs, columns_mib) in zip(legacy_rows, columns_rows):
+            row = [n_members, n_deps, name, f"{legacy_secs:.4f}", f"{legacy_mib:.2f}"]
+            print(" ".join(f"{x:>11}" for x in row + [f"{columns_secs:.4f}", f"{columns_mib:.2f}"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Compares the sparse component grouping in `filesplitter.graph` with the dense one it replaced.
+
+Usage: python -m benchmarks.bench_graph
+"""
+import time
+
+import numpy as np
+import pandas as pd
+from ordered_set import OrderedSet as oset
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+from filesplitter.graph import group_by_scc, group_by_wcc, group_edges_by
+
+# The dense version needs n_nodes**2 floats, so it is skipped above this size
+LEGACY_MAX_NODES = 10_000
+
+
+def legacy_group_by(seq, edges, connection):
+    "The old dense grouping (an N x N matrix filled with `oset.index` lookups)."
+    nodes = oset(seq)
+    arr = np.zeros((len(nodes), len(nodes)))
+    for src, tgt in edges:
+        arr[nodes.index(src), nodes.index(tgt)] = 1.0
+    _, labels = connected_components(csr_matrix(arr), connection=connection, directed=True, return_labels=True)
+    return [labels[nodes.index(e)] for e in seq]
+
+
+def legacy_group_edges_by(edges, col):
+    return oset((col.loc[a], col.loc[b]) for a, b in edges)
+
+
+def main():
+    print(f"{'nodes':>8} {'edges':>8} {'legacy (s)':>12} {'sparse (s)':>12} {'same':>6}")
+    for n_nodes in [1_000, 5_000, 10_000, 100_000]:
+        rng = np.random.default_rng(n_nodes)
+        col = pd.Series(rng.integers(0, n_nodes // 2, n_nodes), index=np.arange(n_nodes))
+        edges = oset(map(tuple, rng.integers(0, n_nodes, (3 * n_nodes, 2)).tolist()))
+
+        start = time.perf_counter()
+        grouped = group_edges_by(edges, col)
+        labels = (group_by_scc(col, grouped), group_by_wcc(col, grouped))
+        elapsed = time.perf_counter() - start
+
+        legacy, same = "-", "-"
+        if n_nodes <= LEGACY_MAX_NODES:
+            start = time.perf_counter()
+            legacy_grouped = legacy_group_edges_by(edges, col)
+            legacy_labels = (
+                legacy_group_by(col, legacy_grouped, "strong"),
+                legacy_group_by(col, legacy_grouped, "weak"),
+            )
+            legacy = f"{time.perf_counter() - start:.4f}"
+            same = str(list(legacy_grouped) == list(grouped) and all(a == b for a, b in zip(legacy_labels, labels)))
+        print(f"{n_nodes:>8} {len(edges):>8} {legacy:>12} {elapsed:>12.4f} {same:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Compares CP-SAT bisections started cold with ones hinted by the greedy heuristic.
+
+Usage: python -m benchmarks.bench_hints
+"""
+import time
+
+from ortools.sat.python import cp_model
+
+from benchmarks._synthetic import random_bisection
+from filesplitter import ilp
+from filesplitter.clustering import CUT_EPS
+from filesplitter.heuristics import greedy_bisect
+
+MAX_TIME_IN_SECONDS = 30
+
+
+class SolutionTimes(cp_model.CpSolverSolutionCallback):
+    "Records when the first solution and the best solution were found."
+
+    def __init__(self):
+        super().__init__()
+        self.start = time.perf_counter()
+        self.first = None
+        self.best = None
+
+    def on_solution_callback(self):
+        elapsed = time.perf_counter() - self.start
+        if self.first is None:
+            self.first = elapsed
+        self.best = elapsed
+
+
+def solve(problem, hint):
+    di_edges, un_edges, node_weights, edge_weights = problem
+    times = SolutionTimes()
+    cut, _, _ = ilp.bisect(
+        di_edges, un_edges, node_weights, edge_weights, 2, CUT_EPS, MAX_TIME_IN_SECONDS, hint=hint, callback=times
+    )
+    total = time.perf_counter() - times.start
+    # Finishing before the time limit means the solution was proven optimal
+    optimal = f"{total:.3f}" if total < MAX_TIME_IN_SECONDS * 0.99 else "-"
+    first = f"{times.first:.3f}" if times.first is not None else "-"
+    best = f"{times.best:.3f}" if times.best is not None else "-"
+    return [f"{cut:.0f}", first, best, optimal]
+
+
+def main():
+    header = ["nodes", "hint", "cut", "first (s)", "best (s)", "optimal (s)"]
+    print(" ".join(f"{h:>12}" for h in header))
+    for n_nodes in [25, 50, 75, 100, 200, 400]:
+        problem = random_bisection(n_nodes, seed=n_nodes)
+        _, hint, _ = greedy_bisect(*problem, 2, CUT_EPS)
+        for name, h in [("none", None), ("greedy", hint)]:
+            row = [str(n_nodes), name] + solve(problem, h)
+            print(" ".join(f"{x:>12}" for x in row))
+    print(f"(The solver is limited to {MAX_TIME_IN_SECONDS} secs; '-' under optimal means it was not proven.)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""Runs the index advisor (`filesplitter.index_advisor`) on a database: the scans in the query plan of each fetch
+function and how long it takes, before and after creating the missing indexes on a copy.
+
+Usage: python -m benchmarks.bench_indexes [DB_PATH]
+
+Without a path, a random database is generated.
+"""
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+from benchmarks._synthetic import random_database
+from filesplitter import db
+from filesplitter.index_advisor import advise, find_scans, prepare_fetches, sample_params
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if len(sys.argv) > 1:
+            db_path = sys.argv[1]
+        else:
+            db_path = os.path.join(tmp_dir, "subject.db")
+            random_database(db_path, 2_000, seed=0)
+        with db.connect(db_path) as con:
+            db.create_temp_tables(con)
+            params = sample_params(con)
+            prepare_fetches(con, params)
+            with pd.option_context("display.max_colwidth", None, "display.max_rows", None):
+                print(find_scans(con, params).to_string(index=False))
+        report = advise(db_path, copy_path=os.path.join(tmp_dir, "indexed.db"))
+    with pd.option_context("display.float_format", "{:.4f}".format):
+        print(report)
+        print(report[["seconds", "indexed_seconds"]].sum().rename("total").to_frame().T)
+
+
+if __name__ == "__main__":
+    main()
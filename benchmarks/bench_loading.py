@@ -0,0 +1,51 @@
+"""Compares the time it takes `load_dataset` to load a single file with the full prelude, with the prelude
+scoped to the file and with prepared tables (on random databases of growing size).
+
+Usage: python -m benchmarks.bench_loading
+"""
+import os
+import sqlite3
+import tempfile
+import time
+
+from benchmarks._synthetic import random_database
+from filesplitter.loading import load_dataset, prepare_database
+
+MODES = {"full": {}, "scoped": {"scoped": True}, "prepared": {"prepared": True}}
+
+
+def same(a, b):
+    "Compares two datasets (ignoring the order of rows, which the queries don't always fix)."
+    fields = ["targets_df", "target_deps_df", "clients_df", "client_deps_df", "touches_df"]
+    dfs = [(getattr(a, f).reset_index(), getattr(b, f).reset_index()) for f in fields]
+    return a.outgoing_type_names == b.outgoing_type_names and all(
+        x.sort_values(list(x.columns), ignore_index=True).equals(y.sort_values(list(y.columns), ignore_index=True))
+        for x, y in dfs
+    )
+
+
+def main():
+    print(f"{'files':>8} {'entities':>9} {'prepare (s)':>12} " + " ".join(f"{m + ' (s)':>13}" for m in MODES))
+    for n_files in [200, 1_000, 5_000]:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, "subject.db")
+            random_database(db_path, n_files, seed=n_files)
+            filename = f"src/main/pkg0/File{n_files // 2 // 20 * 20}.java"
+
+            start = time.perf_counter()
+            prepare_database(db_path)
+            prepare_time = time.perf_counter() - start
+
+            times, datasets = [], []
+            for kwargs in MODES.values():
+                start = time.perf_counter()
+                datasets.append(load_dataset(db_path, filename, **kwargs))
+                times.append(time.perf_counter() - start)
+            assert all(same(datasets[0], ds) for ds in datasets[1:])
+            with sqlite3.connect(db_path) as con:
+                n_entities = con.execute("SELECT COUNT(*) FROM entities").fetchone()[0]
+            print(f"{n_files:>8} {n_entities:>9} {prepare_time:>12.3f} " + " ".join(f"{t:>13.3f}" for t in times))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Compares the loop-based and vectorized builders of the NameSimilarity MI matrix.
+
+Usage: python -m benchmarks.bench_mi_matrix
+"""
+import math
+import time
+from collections import Counter
+from functools import cache
+from itertools import chain
+
+import numpy as np
+from ordered_set import OrderedSet as oset
+
+from benchmarks._synthetic import random_names
+from filesplitter.naming import mi_matrix, to_count_arrays, to_occurrences
+
+
+def to_pair_counts(names: list[str], lookback: int = 1) -> Counter:
+    pair_counts = Counter(chain(*(to_occurrences(n, lookback) for n in names)))
+    term_counts = Counter(t for t, _ in pair_counts.elements())
+    isolated_terms = {t for t, c in term_counts.items() if c <= 1}
+    return Counter({(t, d): c for (t, d), c in pair_counts.items() if t not in isolated_terms})
+
+
+def legacy_mi_matrix(pair_counts: Counter, terms: oset, docs: oset) -> np.ndarray:
+    "The nested-loop builder that NameSimilarity used before it was vectorized."
+    term_counts = Counter(t for t, _ in pair_counts.elements())
+    doc_counts = Counter(d for _, d in pair_counts.elements())
+    total = pair_counts.total()
+
+    @cache
+    def p_i_1(term):
+        return term_counts[term] / total
+
+    @cache
+    def p_i_0(term):
+        return (total - term_counts[term]) / total
+
+    @cache
+    def p_j_1(doc):
+        return doc_counts[doc] / total
+
+    @cache
+    def p_j_0(doc):
+        return (total - doc_counts[doc]) / total
+
+    @cache
+    def p_ij_11(term, doc):
+        return pair_counts[term, doc] / total
+
+    @cache
+    def p_ij_10(term, doc):
+        return (term_counts[term] - pair_counts[term, doc]) / total
+
+    @cache
+    def p_ij_01(term, doc):
+        return (doc_counts[doc] - pair_counts[term, doc]) / total
+
+    @cache
+    def p_ij_00(term, doc):
+        return (total + pair_counts[term, doc] - term_counts[term] - doc_counts[doc]) / total
+
+    def log(x):
+        return 0.0 if x == 0.0 else math.log(x)
+
+    def mi(term, doc):
+        a = p_ij_11(term, doc) * log(p_ij_11(term, doc) / (p_i_1(term) * p_j_1(doc)))
+        b = p_ij_10(term, doc) * log(p_ij_10(term, doc) / (p_i_1(term) * p_j_0(doc)))
+        c = p_ij_01(term, doc) * log(p_ij_01(term, doc) / (p_i_0(term) * p_j_1(doc)))
+        d = p_ij_00(term, doc) * log(p_ij_00(term, doc) / (p_i_0(term) * p_j_0(doc)))
+        return a + b + c + d
+
+    arr = np.zeros((len(terms), len(docs)))
+    for i, term in enumerate(terms):
+        for j, doc in enumerate(docs):
+            arr[i, j] = mi(term, doc)
+    return arr
+
+
+def main():
+    print(f"{'words':>6} {'names':>6} {'terms':>6} {'docs':>6} {'legacy (s)':>11} {'vector (s)':>11} {'speedup':>8} {'max |diff|':>11}")
+    for n_words in [50, 100, 200, 400, 800]:
+        n_names = 4 * n_words
+        pair_counts = to_pair_counts(random_names(n_names, n_words))
+        terms = oset(t for t, _ in pair_counts)
+        docs = oset(d for _, d in pair_counts)
+
+        start = time.perf_counter()
+        legacy = legacy_mi_matrix(pair_counts, terms, docs)
+        legacy_secs = time.perf_counter() - start
+
+        start = time.perf_counter()
+        vector = mi_matrix(*to_count_arrays(pair_counts, terms, docs))
+        vector_secs = time.perf_counter() - start
+
+        diff = np.max(np.abs(legacy - vector))
+        assert np.allclose(legacy, vector, rtol=1e-12, atol=1e-15)
+        speedup = legacy_secs / vector_secs
+        print(f"{n_words:>6} {n_names:>6} {len(terms):>6} {len(docs):>6} {legacy_secs:>11.4f} {vector_secs:>11.4f} {speedup:>7.1f}x {diff:>11.2e}")
+
+
+if __name__ == "__main__":
+    main()
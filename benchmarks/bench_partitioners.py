@@ -0,0 +1,33 @@
+"""Compares the cut weight and wall time of the exact and heuristic partitioners on random bisections.
+
+Usage: python -m benchmarks.bench_partitioners
+"""
+import time
+
+from benchmarks._synthetic import random_bisection
+from filesplitter.clustering import CUT_EPS
+from filesplitter.heuristics import PARTITIONERS, choose_partitioner
+
+MAX_TIME_IN_SECONDS = 30
+
+
+def main():
+    names = list(PARTITIONERS)
+    print(f"{'nodes':>6} {'edges':>6} {'auto':>9} " + " ".join(f"{n + ' cut':>14} {n + ' (s)':>12}" for n in names))
+    for n_nodes in [25, 50, 100, 200, 400, 800]:
+        di_edges, un_edges, node_weights, edge_weights = random_bisection(n_nodes, seed=n_nodes)
+        cols = []
+        for name in names:
+            start = time.perf_counter()
+            cut, labels, _ = PARTITIONERS[name](
+                di_edges, un_edges, node_weights, edge_weights, 2, CUT_EPS, MAX_TIME_IN_SECONDS
+            )
+            elapsed = time.perf_counter() - start
+            cols.append(f"{cut:>14.0f} {elapsed:>12.4f}" if labels is not None else f"{'failed':>14} {elapsed:>12.4f}")
+        auto = choose_partitioner(di_edges, un_edges)
+        print(f"{n_nodes:>6} {len(di_edges | un_edges):>6} {auto:>9} " + " ".join(cols))
+    print(f"(The exact partitioner is limited to {MAX_TIME_IN_SECONDS} secs.)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Compares the pairwise, batched and sparse builders of the NameSimilarity similarity matrix.
+
+Usage: python -m benchmarks.bench_sim_matrix
+"""
+import time
+
+import numpy as np
+from ordered_set import OrderedSet as oset
+
+from benchmarks._synthetic import random_names
+from benchmarks.bench_mi_matrix import to_pair_counts
+from filesplitter.naming import mi_matrix, pos_cor_matrix, sparse_pos_cor_matrix, to_count_arrays
+
+TOP_K = 16
+MIN_SIM = 0.35
+
+
+def legacy_pos_cor_matrix(arr: np.ndarray) -> np.ndarray:
+    "The pairwise builder that NameSimilarity used before it was batched."
+
+    def center(vec):
+        return vec - np.mean(vec)
+
+    def norm(vec):
+        return np.linalg.norm(vec)
+
+    def pos_cor(a, b):
+        return max(0, np.dot(center(a), center(b)) / (norm(a) * norm(b)))
+
+    n = arr.shape[1]
+    sim_mat = np.zeros((n, n))
+    for i in range(n):
+        for j in range(i, n):
+            sim_mat[i, j] = sim_mat[j, i] = pos_cor(arr[:, i], arr[:, j])
+    return sim_mat
+
+
+def timed(f, *args, **kwargs):
+    start = time.perf_counter()
+    res = f(*args, **kwargs)
+    return res, time.perf_counter() - start
+
+
+def main():
+    header = ["docs", "legacy (s)", "batched (s)", "max |diff|", "top-k (s)", "top-k nnz", "min-sim (s)", "min-sim nnz"]
+    print(" ".join(f"{h:>12}" for h in header))
+    for n_words in [50, 100, 200, 400]:
+        pair_counts = to_pair_counts(random_names(4 * n_words, n_words))
+        terms = oset(t for t, _ in pair_counts)
+        docs = oset(d for _, d in pair_counts)
+        arr = mi_matrix(*to_count_arrays(pair_counts, terms, docs))
+
+        legacy, legacy_secs = timed(legacy_pos_cor_matrix, arr)
+        batched, batched_secs = timed(pos_cor_matrix, arr)
+        top_k, top_k_secs = timed(sparse_pos_cor_matrix, arr, top_k=TOP_K)
+        min_sim, min_sim_secs = timed(sparse_pos_cor_matrix, arr, min_sim=MIN_SIM)
+
+        assert np.allclose(legacy, batched)
+        kept = legacy >= MIN_SIM
+        assert np.allclose(min_sim.toarray()[kept], legacy[kept])
+        diff = np.max(np.abs(legacy - batched))
+        row = [len(docs), legacy_secs, batched_secs, diff, top_k_secs, top_k.nnz, min_sim_secs, min_sim.nnz]
+        print(" ".join(f"{x:>12.4g}" if isinstance(x, float) else f"{x:>12}" for x in row))
+    print(f"(A dense matrix holds docs^2 entries; top-k uses k={TOP_K} and min-sim uses {MIN_SIM}.)")
+
+
+if __name__ == "__main__":
+    main()
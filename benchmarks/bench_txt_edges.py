@@ -0,0 +1,54 @@
+"""Compares the pairwise and aggregated builders of the text edges between strong components.
+
+Usage: python -m benchmarks.bench_txt_edges
+"""
+import time
+
+import pandas as pd
+from ordered_set import OrderedSet as oset
+
+from benchmarks._synthetic import random_dataset
+from filesplitter.clustering import TEXT_EDGE_MIN_SIM, build_txt_edges, max_group_sim
+from filesplitter.graph import group_by_scc, group_edges_by
+from filesplitter.naming import NameSimilarity
+
+
+def legacy_build_txt_edges(entities_df: pd.DataFrame, sim: NameSimilarity) -> dict[tuple[int, int], float]:
+    "The builder that compared every pair of strong components with `max_group_sim`."
+    edges = {}
+    nonfiles = entities_df[entities_df["kind"] != "file"]
+    strong_names = nonfiles.groupby("strong_id")["name"].apply(list).to_dict()
+    for a_ix in range(len(strong_names)):
+        for b_ix in range(a_ix + 1, len(strong_names)):
+            score = max_group_sim(sim, strong_names[a_ix], strong_names[b_ix])
+            if score >= TEXT_EDGE_MIN_SIM:
+                edges[(a_ix, b_ix)] = score
+    return edges
+
+
+def main():
+    print(f"{'members':>8} {'groups':>7} {'edges':>7} {'legacy (s)':>11} {'grouped (s)':>12} {'speedup':>8}")
+    for n_members in [100, 200, 400, 800, 1600]:
+        ds = random_dataset(n_members, seed=n_members)
+        entities_df = ds.entities_df()
+        edges = oset((r.src_id, r.tgt_id) for r in ds.deps_df().itertuples())
+        entities_df["name_id"] = entities_df.groupby("name").ngroup()
+        entities_df["strong_id"] = group_by_scc(entities_df["name_id"], group_edges_by(edges, entities_df["name_id"]))
+        sim = NameSimilarity(list(ds.targets_df["name"]))
+
+        start = time.perf_counter()
+        legacy = legacy_build_txt_edges(entities_df, sim)
+        legacy_secs = time.perf_counter() - start
+
+        start = time.perf_counter()
+        grouped = build_txt_edges(entities_df, sim)
+        grouped_secs = time.perf_counter() - start
+
+        assert legacy == grouped
+        n_groups = entities_df["strong_id"].nunique()
+        speedup = legacy_secs / grouped_secs
+        print(f"{n_members:>8} {n_groups:>7} {len(grouped):>7} {legacy_secs:>11.4f} {grouped_secs:>12.4f} {speedup:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Compares the cost of the node and edge weight lookups made while building one CP-SAT model, using the
+per-call DataFrame filters that `cluster_dataset` used to have versus the precomputed weight tables.
+
+Usage: python -m benchmarks.bench_weights
+"""
+import time
+
+from ordered_set import OrderedSet as oset
+
+from benchmarks._synthetic import random_dataset
+from filesplitter.clustering import (
+    TEXT_EDGE_MULTIPLIER,
+    UNIT_EDGE_WEIGTH,
+    build_txt_edges,
+    to_edge_weights,
+    to_strong_weights,
+)
+from filesplitter.graph import group_by_scc, group_edges_by
+from filesplitter.naming import NameSimilarity
+
+
+def main():
+    print(f"{'members':>8} {'nodes':>6} {'edges':>6} {'legacy (s)':>11} {'tables (s)':>11} {'speedup':>8}")
+    for n_members in [250, 500, 1000, 2000, 4000]:
+        ds = random_dataset(n_members, seed=n_members)
+        entities_df = ds.entities_df()
+        edges = oset((r.src_id, r.tgt_id) for r in ds.deps_df().itertuples())
+        entities_df["name_id"] = entities_df.groupby("name").ngroup()
+        entities_df["strong_id"] = group_by_scc(entities_df["name_id"], group_edges_by(edges, entities_df["name_id"]))
+        strong_edges = group_edges_by(edges, entities_df["strong_id"])
+        txt_edge_weights = build_txt_edges(entities_df, NameSimilarity(list(ds.targets_df["name"])))
+        txt_edges = set(txt_edge_weights)
+        nodes = list(set(entities_df["strong_id"]))
+        all_edges = set(strong_edges) | txt_edges
+
+        def get_entity_weight(id):
+            return 0 if entities_df.loc[id]["kind"] == "file" else 1
+
+        def get_strong_weight(strong_id):
+            ids = entities_df[entities_df["strong_id"] == strong_id].index
+            return sum(get_entity_weight(id) for id in ids)
+
+        def get_edge_weight(a, b):
+            weight = 0
+            if (a, b) in strong_edges:
+                weight += UNIT_EDGE_WEIGTH
+            if (a, b) in txt_edges:
+                weight += round(txt_edge_weights[a, b] * UNIT_EDGE_WEIGTH * TEXT_EDGE_MULTIPLIER)
+            return weight
+
+        # One model for a bisection reads every node weight three times and every edge weight once
+        start = time.perf_counter()
+        legacy = [get_strong_weight(i) for i in nodes * 3] + [get_edge_weight(a, b) for a, b in all_edges]
+        legacy_secs = time.perf_counter() - start
+
+        start = time.perf_counter()
+        strong_weights = to_strong_weights(entities_df)
+        edge_weights = to_edge_weights(strong_edges, txt_edge_weights)
+        tables = [strong_weights[i] for i in nodes * 3] + [edge_weights[e] for e in all_edges]
+        tables_secs = time.perf_counter() - start
+
+        assert legacy == tables
+        speedup = legacy_secs / tables_secs
+        print(f"{n_members:>8} {len(nodes):>6} {len(all_edges):>6} {legacy_secs:>11.4f} {tables_secs:>11.4f} {speedup:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,22 @@
+import os
 import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, replace
+from math import inf
+from typing import Callable, Iterable
 
 import numpy as np
 import pandas as pd
 import scipy as sp
 from sklearn.cluster import DBSCAN
-from ordered_set import OrderedSet as oset
 
-from filesplitter import ilp
-from filesplitter.graph import group_by_scc, group_by_wcc, group_edges_by
+from filesplitter import heuristics, ilp
+from filesplitter.graph import Edges, group_by_scc, group_by_wcc, index_of, pack_pairs, unpack_pairs
 from filesplitter.loading import Dataset
 from filesplitter.naming import NameSimilarity
+from filesplitter.partition_cache import PartitionCache, subproblem_key
 
 # WE SHOULD NOT SPLIT BY WEAKLY CONNECTED COMPONENT UNTIL WE HAVE TEXT INFORMATION
 
@@ -20,6 +27,9 @@ TEXT_CLX_MIN_PTS = 3
 
 TEXT_SIM_LOOKBACK = 1
 
+# Only keep the text similarities that can become text edges (saves memory on large files)
+SPARSE_TEXT_SIM = False
+
 # This is for use in the ILP portion
 USE_TEXT_EDGES = True
 TEXT_EDGE_MIN_SIM = 0.35 # or use percentile?
@@ -36,6 +46,39 @@ USE_ALL = True
 CUT_EPS = 1/2
 MAX_WEIGHT = 24
 
+# How to bisect: "exact" (CP-SAT), "greedy" or "spectral" (heuristics), "hybrid" (heuristic then exact), or
+# "auto" (pick one by the size of the subproblem, see `heuristics.choose_partitioner`)
+PARTITIONER = "exact"
+
+# Warm start each exact bisection with a greedy split (and the blocks from a previous run, if one is given)
+HINT_BISECTIONS = True
+
+# An overall deadline (in seconds) for the bisections of a run, or None for no deadline
+TIME_BUDGET = None
+
+# No bisection may take longer than this (in seconds)
+MAX_SOLVE_TIME = 120
+
+# Bisections that would get less time than this (in seconds) use the fallback instead
+MIN_SOLVE_TIME = 1.0
+
+# With USE_ALL, merge the connected groups of inactive nodes so that models grow with the active set. This is an
+# approximation: the nodes of a group always end up in the same part, which can rule out the optimal split.
+CONTRACT_INACTIVE = False
+
+# The settings for CP-SAT (see `ilp.SolverParams`, where the time limit comes from MAX_SOLVE_TIME instead)
+SOLVER_PARAMS = ilp.SolverParams()
+
+# What to do once the time budget is spent: split with a heuristic ("greedy" or "spectral") or None to stop
+BUDGET_FALLBACK = "greedy"
+
+# The fraction of the time budget kept for the fallback (the exact solves share the rest). The fallback counts
+# against the budget too, so the subproblems that are left once all of it is spent are not split at all.
+FALLBACK_RESERVE = 0.25
+
+# The number of processes used to solve independent bisections (1 solves them one at a time in this process)
+N_JOBS = 1
+
 
 # Big mess but it works
 def to_name_cluster_labels(entities_df: pd.DataFrame, sim: NameSimilarity, labels: list[int]):
@@ -86,28 +129,479 @@ def max_group_sim(sim: NameSimilarity, a_names: list[str], b_names: list[str]):
 
 
 def build_txt_edges(entities_df: pd.DataFrame, sim: NameSimilarity) -> dict[tuple[int, int], float]:
-    edges = {}
     nonfiles = entities_df[entities_df["kind"] != "file"]
     strong_names = nonfiles.groupby("strong_id")["name"].apply(list).to_dict()
-    strong_ids = list(strong_names.keys())
-    for a_ix in range(len(strong_ids)):
-        a_names = strong_names[a_ix]
-        for b_ix in range(a_ix + 1, len(strong_ids)):
-            b_names = strong_names[b_ix]
-            score = max_group_sim(sim, a_names, b_names)
-            if score >= TEXT_EDGE_MIN_SIM:
-                edges[(a_ix, b_ix)] = score
-    return edges
+    # Same as `max_group_sim` for every pair of strong components, but in one pass over the `sim_mat`
+    scores = sim.group_sim_mat([strong_names[ix] for ix in range(len(strong_names))], "max")
+    a_ixs, b_ixs = np.nonzero(np.triu(scores >= TEXT_EDGE_MIN_SIM, 1))
+    return {(int(a_ix), int(b_ix)): scores[a_ix, b_ix] for a_ix, b_ix in zip(a_ixs, b_ixs)}
+
+
+def to_strong_weights(entities_df: pd.DataFrame) -> dict[int, int]:
+    "Counts the entities (other than files) in each strong component."
+    is_member = (entities_df["kind"] != "file").astype(int)
+    return {int(k): int(v) for k, v in is_member.groupby(entities_df["strong_id"]).sum().items()}
+
+
+def to_edge_weights(
+    strong_edges: Iterable[tuple[int, int]], txt_edge_weights: dict[tuple[int, int], float]
+) -> dict[tuple[int, int], int]:
+    "Combines the dependency and text edges between strong components into one integer weight per edge."
+    weights = {key: UNIT_EDGE_WEIGTH for key in strong_edges}
+    if USE_TEXT_EDGES:
+        for key, sim in txt_edge_weights.items():
+            weights[key] = weights.get(key, 0) + round(sim * UNIT_EDGE_WEIGTH * TEXT_EDGE_MULTIPLIER)
+    return weights
+
+
+def to_previous_block_names(entities_df: pd.DataFrame, previous: pd.DataFrame) -> dict[int, str]:
+    "Finds the block that most of the entities of each strong component were in during a previous run."
+    prev_block_names = previous["block_name"].to_dict()
+    votes = defaultdict(Counter)
+    for id, strong_id in entities_df["strong_id"].items():
+        if isinstance(prev_block_names.get(id), str):
+            votes[strong_id][prev_block_names[id]] += 1
+    return {strong_id: c.most_common(1)[0][0] for strong_id, c in votes.items()}
+
+
+@contextmanager
+def _timed(timings: dict[str, float], stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+# The status of a block is the worst status of the bisections that produced it (in this order)
+STATUSES = ["optimal", "feasible", "heuristic", "fallback", "unsplit"]
+
+
+def worst_status(a: str, b: str) -> str:
+    return max(a, b, key=STATUSES.index)
+
+
+@dataclass
+class Subproblem:
+    name: str
+    # The edges of the entire weakly connected component (of kind "dep" or "text")
+    edges: Edges
+    # The strong components that still need to be split
+    active: set[int]
+    # A suggested part (0 or 1) for some of the strong components (e.g. from a previous run)
+    hint: dict[int, int] | None = None
+    # How long the bisection may take (None for MAX_SOLVE_TIME)
+    time_limit: float | None = None
+    # Whether there is time left for the fallback if there isn't enough for the bisection
+    fallback_time: bool = True
+    # The settings for CP-SAT (None for the defaults)
+    params: ilp.SolverParams | None = None
+    # The worst status of the bisections that led to this subproblem
+    status: str = "optimal"
+    # The number of bisections that led to this subproblem
+    depth: int = 0
+
+    def active_mask(self) -> np.ndarray:
+        "Selects the edges between the strong components that still need to be split."
+        return self.edges.within(np.fromiter(self.active, dtype=np.int64, count=len(self.active)))
+
+
+@dataclass
+class DepthStats:
+    "The sizes of the bisections at one depth of the recursion."
+    bisections: int = 0
+    # Summed over the bisections (before and after contraction)
+    nodes: int = 0
+    edges: int = 0
+    model_nodes: int = 0
+    model_edges: int = 0
+    wall_time: float = 0.0
+
+
+@dataclass
+class Contraction:
+    dep_edges: set[tuple[int, int]]
+    txt_edges: set[tuple[int, int]]
+    edge_weights: dict[tuple[int, int], int]
+    # The super-node (which has a negative id) of each inactive node
+    super_nodes: dict[int, int]
+
+    def contract_hint(self, hint: dict[int, int] | None) -> dict[int, int] | None:
+        return None if hint is None else {self.super_nodes.get(i, i): l for i, l in hint.items()}
+
+    def expand_labels(self, labels: dict[int, int] | None) -> dict[int, int] | None:
+        if labels is None:
+            return None
+        expanded = {i: l for i, l in labels.items() if i >= 0}
+        expanded.update({i: labels[s] for i, s in self.super_nodes.items() if s in labels})
+        return expanded
+
+
+def _sum_by_key(keys: np.ndarray, weights: np.ndarray) -> dict[tuple[int, int], int]:
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    sums = np.bincount(inverse, weights=weights, minlength=len(uniq)).astype(np.int64)
+    src, tgt = unpack_pairs(uniq)
+    return dict(zip(zip(src.tolist(), tgt.tolist()), sums.tolist()))
+
+
+def contract_inactive(
+    dep_edges: Edges, txt_edges: Edges, edge_weights: dict[tuple[int, int], int], active: set[int]
+) -> Contraction:
+    """Merges each connected group of inactive nodes into a single (weightless) super-node. The edges between
+    two nodes are merged as well, where an edge is directed if any of the edges it replaces is directed. A split
+    of the contracted graph has the same cut weight as its expansion in the original graph, but the original
+    graph can have better splits (ones that separate the nodes of a group)."""
+    # Same preprocessing as `ilp.partition2`
+    dep_edges = dep_edges[dep_edges.src != dep_edges.tgt].unique()
+    txt_edges = txt_edges[txt_edges.src != txt_edges.tgt].unique()
+    txt_edges = txt_edges[~np.isin(txt_edges.keys(), dep_edges.keys())]
+    edges = Edges.concat([dep_edges, txt_edges])
+    is_dep = np.arange(len(edges)) < len(dep_edges)
+    weights = np.array([edge_weights[a, b] for a, b in zip(edges.src.tolist(), edges.tgt.tolist())], dtype=np.int64)
+
+    # Find the connected groups of inactive nodes
+    active = np.fromiter(active, dtype=np.int64, count=len(active))
+    src_active, tgt_active = np.isin(edges.src, active), np.isin(edges.tgt, active)
+    inactive = np.unique(np.concatenate([edges.src[~src_active], edges.tgt[~tgt_active]]))
+    inner = ~src_active & ~tgt_active
+    rows, cols = index_of(inactive, edges.src[inner]), index_of(inactive, edges.tgt[inner])
+    adj = sp.sparse.coo_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(inactive), len(inactive)))
+    _, comp_labels = sp.sparse.csgraph.connected_components(adj, directed=False)
+    super_ids = -1 - comp_labels.astype(np.int64)
+
+    # Replace each inactive endpoint with its super-node
+    src, tgt = edges.src.astype(np.int64), edges.tgt.astype(np.int64)
+    src[~src_active] = super_ids[index_of(inactive, src[~src_active])]
+    tgt[~tgt_active] = super_ids[index_of(inactive, tgt[~tgt_active])]
+    keep = src != tgt
+
+    # An undirected edge is cut exactly when a directed edge between the same nodes is cut
+    di_keys = pack_pairs(src[keep & is_dep], tgt[keep & is_dep])
+    un = keep & ~is_dep
+    fwd_keys, rev_keys = pack_pairs(src[un], tgt[un]), pack_pairs(tgt[un], src[un])
+    in_fwd = np.isin(fwd_keys, di_keys)
+    in_rev = ~in_fwd & np.isin(rev_keys, di_keys)
+    rest = ~in_fwd & ~in_rev
+    di_weights = _sum_by_key(
+        np.concatenate([di_keys, fwd_keys[in_fwd], rev_keys[in_rev]]),
+        np.concatenate([weights[keep & is_dep], weights[un][in_fwd], weights[un][in_rev]]),
+    )
+    un_src, un_tgt = src[un][rest], tgt[un][rest]
+    un_weights = _sum_by_key(pack_pairs(np.minimum(un_src, un_tgt), np.maximum(un_src, un_tgt)), weights[un][rest])
+    super_nodes = dict(zip(inactive.tolist(), super_ids.tolist()))
+    return Contraction(set(di_weights), set(un_weights), di_weights | un_weights, super_nodes)
+
+
+def bisect(
+    sub: Subproblem, strong_weights: dict[int, int], edge_weights: dict[tuple[int, int], int]
+) -> tuple[float, dict[int, int] | None, ilp.SolveStats]:
+    def w(strong_id: int) -> int:
+        if strong_id not in sub.active:
+            return 0
+        return strong_weights[strong_id]
+
+    # There are two ways to use `active`:
+    # 1) Use ILP to bisect only the active elements
+    #    - This might be faster.
+    # 2) Use ILP to bisect all elements, but non-active elements are weighted to 0
+    #    - This might produce better results.
+    edges = sub.edges if USE_ALL else sub.edges[sub.active_mask()]
+    dep_edges = edges[edges.kind == "dep"]
+    txt_edges = edges[(edges.kind == "text") & USE_TEXT_EDGES]
+    if not USE_TEXT_EDGES:
+        edge_weights = {key: 1 for key in dep_edges.pairs()}
+
+    if USE_ALL and CONTRACT_INACTIVE:
+        con = contract_inactive(dep_edges, txt_edges, edge_weights, sub.active)
+        hint = con.contract_hint(sub.hint)
+        cut_weight, labels, stats = _bisect_graph(sub, con.dep_edges, con.txt_edges, w, con.edge_weights, hint)
+        # Keeping the inactive groups together may rule out every balanced split, so unless the solver ran out
+        # of time, try again without contraction
+        time_limit = MAX_SOLVE_TIME if sub.time_limit is None else sub.time_limit
+        if labels is not None or MIN_SOLVE_TIME <= time_limit <= stats.wall_time:
+            return cut_weight, con.expand_labels(labels), stats
+    return _bisect_graph(sub, dep_edges.pairs(), txt_edges.pairs(), w, edge_weights, sub.hint)
+
+
+def _bisect_graph(
+    sub: Subproblem,
+    dep_edges: set[tuple[int, int]],
+    txt_edges: set[tuple[int, int]],
+    w: Callable[[int], int],
+    edge_weights: dict[tuple[int, int], int],
+    hint: dict[int, int] | None,
+) -> tuple[float, dict[int, int] | None, ilp.SolveStats]:
+    cut_weight, labels, stats = _bisect_model(sub, dep_edges, txt_edges, w, edge_weights, hint)
+    stats.model_nodes = len({a for a, _ in dep_edges | txt_edges} | {b for _, b in dep_edges | txt_edges})
+    stats.model_edges = len(dep_edges | txt_edges)
+    return cut_weight, labels, stats
+
+
+def _bisect_model(
+    sub: Subproblem,
+    dep_edges: set[tuple[int, int]],
+    txt_edges: set[tuple[int, int]],
+    w: Callable[[int], int],
+    edge_weights: dict[tuple[int, int], int],
+    hint: dict[int, int] | None,
+) -> tuple[float, dict[int, int] | None, ilp.SolveStats]:
+    # Once the time budget is spent, fall back to a cheap split (or none at all)
+    time_limit = MAX_SOLVE_TIME if sub.time_limit is None else sub.time_limit
+    if time_limit < MIN_SOLVE_TIME:
+        if BUDGET_FALLBACK is None or not sub.fallback_time:
+            return inf, None, ilp.SolveStats("unsplit", inf, 0.0)
+        partition = heuristics.PARTITIONERS[BUDGET_FALLBACK]
+        cut_weight, labels, stats = partition(dep_edges, txt_edges, w, edge_weights, 2, CUT_EPS, hint=hint)
+        stats.status = "fallback" if labels is not None else "unsplit"
+        return cut_weight, labels, stats
+
+    if USE_TEXT_EDGES:
+        name = PARTITIONER
+        if name == "auto":
+            name = heuristics.choose_partitioner(dep_edges, txt_edges)
+        partition = heuristics.PARTITIONERS[name]
+
+        def solve():
+            full_hint = hint
+            if HINT_BISECTIONS and partition is ilp.bisect:
+                # Give CP-SAT a head start with a cheap split (where the suggested parts take precedence)
+                _, greedy_labels, _ = heuristics.greedy_bisect(dep_edges, txt_edges, w, edge_weights, 2, CUT_EPS)
+                full_hint = (greedy_labels or {}) | (hint or {})
+            args = (dep_edges, txt_edges, w, edge_weights, 2, CUT_EPS, time_limit)
+            return partition(*args, hint=full_hint or None, params=sub.params)
+
+        args = (name, dep_edges, txt_edges, w, edge_weights, time_limit, MAX_SOLVE_TIME, sub.params)
+        return _solve_cached(*args, solve)
+    solve = lambda: ilp.partition(list(dep_edges), w, lambda i, j: edge_weights[i, j], 2, CUT_EPS, sub.params)
+    return _solve_cached("legacy", dep_edges, set(), w, edge_weights, 30.0, 30.0, sub.params, solve)
+
+
+# Solutions are shared with other runs (and other processes) if there is a cache (see `use_partition_cache`)
+_partition_cache: PartitionCache | None = None
+
+
+def use_partition_cache(partition_cache: PartitionCache | None) -> PartitionCache | None:
+    "Sets the cache that `bisect` consults before solving. Returns the previous one (which is left open)."
+    global _partition_cache
+    previous = _partition_cache
+    _partition_cache = partition_cache
+    return previous
+
+
+def _solve_cached(
+    name: str,
+    dep_edges: set[tuple[int, int]],
+    txt_edges: set[tuple[int, int]],
+    w: Callable[[int], int],
+    edge_weights: Callable[[int, int], int] | dict[tuple[int, int], int],
+    time_limit: float,
+    max_time: float,
+    params: ilp.SolverParams | None,
+    solve: Callable[[], tuple[float, dict[int, int] | None, ilp.SolveStats]],
+) -> tuple[float, dict[int, int] | None, ilp.SolveStats]:
+    """Solves through the partition cache. Proven results hold for any time limit, so they are keyed without
+    one. Other results are keyed on the configured `max_time` rather than on the `time_limit` of this solve
+    (which depends on the clock when there is a time budget), and are only stored if they got all of it."""
+    if _partition_cache is None:
+        return solve()
+    proven_key = subproblem_key(name, dep_edges, txt_edges, w, edge_weights, 2, CUT_EPS, None, params)
+    limited_key = subproblem_key(name, dep_edges, txt_edges, w, edge_weights, 2, CUT_EPS, max_time, params)
+    for key in [proven_key, limited_key]:
+        cached = _partition_cache.get(key)
+        if cached is not None:
+            cut_weight, labels, status = cached
+            return cut_weight, labels, ilp.SolveStats(status, cut_weight if labels is not None else inf, 0.0)
+    cut_weight, labels, stats = solve()
+    # Running out of time says more about the machine than about the problem
+    if stats.status in ("optimal", "infeasible"):
+        _partition_cache.put(proven_key, cut_weight, labels, stats.status)
+    elif stats.status != "unknown" and time_limit >= max_time:
+        _partition_cache.put(limited_key, cut_weight, labels, stats.status)
+    return cut_weight, labels, stats
+
+
+# The weight tables of a worker process (see `schedule`)
+_worker_tables = None
+
+
+def _init_worker(
+    strong_weights: dict[int, int], edge_weights: dict[tuple[int, int], int], cache_args: tuple[str, int] | None
+):
+    global _worker_tables, _partition_cache
+    _worker_tables = (strong_weights, edge_weights)
+    if cache_args is not None:
+        # The connection inherited from the parent (through fork) belongs to the parent, so it's left open
+        _partition_cache = PartitionCache(*cache_args)
+
+
+def _timed_bisect(
+    sub: Subproblem, strong_weights: dict[int, int] | None = None, edge_weights: dict | None = None
+) -> tuple[float, dict[int, int] | None, ilp.SolveStats, float]:
+    if strong_weights is None:
+        strong_weights, edge_weights = _worker_tables
+    start = time.perf_counter()
+    cut_weight, labels, stats = bisect(sub, strong_weights, edge_weights)
+    return cut_weight, labels, stats, time.perf_counter() - start
+
+
+def schedule(
+    roots: list[Subproblem],
+    strong_weights: dict[int, int],
+    edge_weights: dict[tuple[int, int], int],
+    n_jobs: int = 1,
+    timings: dict[str, float] | None = None,
+    previous: dict[int, str] | None = None,
+    time_budget: float | None = None,
+    depth_stats: dict[int, DepthStats] | None = None,
+    solver_params: ilp.SolverParams | None = None,
+    solver_stats: list[dict] | None = None,
+) -> tuple[dict[int, str], dict[int, str]]:
+    """Recursively bisects each subproblem until it is light enough, then names each strong component after
+    the block it ended up in. The two halves of a bisection (and the roots) are independent, so with more
+    than one job they are solved concurrently. The block names do not depend on the number of jobs. If the
+    `previous` block name of each strong component is given, it is used to hint each bisection.
+
+    If there is a `time_budget` (in seconds), the time that is left (minus `FALLBACK_RESERVE`) is shared among
+    the pending subproblems by weight. Also returns the status (see `STATUSES`) of the block of each strong component."""
+    timings = {} if timings is None else timings
+    previous = {} if previous is None else previous
+    depth_stats = {} if depth_stats is None else depth_stats
+    solver_stats = [] if solver_stats is None else solver_stats
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    reserve = 0.0 if time_budget is None or BUDGET_FALLBACK is None else time_budget * FALLBACK_RESERVE
+
+    def with_hint(sub: Subproblem) -> Subproblem:
+        a_name, b_name = sub.name + "A", sub.name + "B"
+        hint = {i: 0 if n.startswith(a_name) else 1 for i, n in previous.items() if n.startswith((a_name, b_name))}
+        sub.hint = hint or None
+        return sub
+
+    def weight(sub: Subproblem) -> int:
+        return sum(strong_weights[strong_id] for strong_id in sub.active)
+
+    def allot(sub: Subproblem, pending_weight: int) -> Subproblem:
+        "Gives the subproblem its share of the time that is left."
+        sub.params = solver_params
+        if deadline is not None:
+            remaining = max(0.0, deadline - time.perf_counter())
+            # The exact solves leave the reserve to the fallback
+            exact_remaining = max(0.0, remaining - reserve)
+            share = exact_remaining * max(n_jobs, 1) * weight(sub) / max(pending_weight, 1)
+            sub.time_limit = min(MAX_SOLVE_TIME, exact_remaining, share)
+            sub.fallback_time = remaining > 0
+        return sub
+
+    block_names = {}
+    block_statuses = {}
+    sequential = n_jobs <= 1
+
+    def prefix(sub: Subproblem) -> str:
+        timestamp = time.strftime("%H:%M:%S", time.localtime())
+        return f"[{sub.name}]".ljust(18) + f" ({timestamp})   "
+
+    def start(sub: Subproblem) -> bool:
+        "Prints info about the subproblem and returns whether it needs to be bisected."
+        active_edges = sub.edges[sub.active_mask()].unique()
+        density = len(active_edges) / len(sub.active)
+        info = f"{len(active_edges)} edges and {len(sub.active)} nodes = {density:0.4f} density"
+        print(prefix(sub) + f"Starting... ({info})", end="\t" if sequential else "\n")
+        if weight(sub) <= MAX_WEIGHT:
+            finish(sub, "Aborted. Weight under threshold.", sub.status)
+            return False
+        return True
+
+    def finish(sub: Subproblem, msg: str, status: str):
+        print(msg if sequential else prefix(sub) + msg)
+        block_names.update({i: sub.name for i in sub.active})
+        block_statuses.update({i: status for i in sub.active})
+
+    def split(
+        sub: Subproblem, cut_weight: float, labels: dict[int, int] | None, stats: ilp.SolveStats, elapsed: float
+    ) -> list[Subproblem]:
+        timings["partitioning"] = timings.get("partitioning", 0.0) + elapsed
+        level = depth_stats.setdefault(sub.depth, DepthStats())
+        level.bisections += 1
+        level.nodes += len(sub.edges.nodes())
+        level.edges += len(sub.edges.unique())
+        level.model_nodes += stats.model_nodes
+        level.model_edges += stats.model_edges
+        level.wall_time += elapsed
+        solver_stats.append({"name": sub.name, "depth": sub.depth} | asdict(stats))
+        if labels is None:
+            # An infeasible bisection is final, but one that ran out of time might have been possible
+            status = sub.status if stats.status == "infeasible" else "unsplit"
+            finish(sub, f"Aborted. Failed to partition ({stats.status}).", status)
+            return []
+        status = worst_status(sub.status, stats.status)
+        msg = f"Bisected with a cut weight of {cut_weight} in {elapsed:0.4f} secs ({stats.status})."
+        print(msg if sequential else prefix(sub) + msg)
+        active_A = sub.active & {i for i, l in labels.items() if l == 0}
+        active_B = sub.active & {i for i, l in labels.items() if l == 1}
+        return [
+            with_hint(Subproblem(sub.name + "A", sub.edges, active_A, status=status, depth=sub.depth + 1)),
+            with_hint(Subproblem(sub.name + "B", sub.edges, active_B, status=status, depth=sub.depth + 1)),
+        ]
+
+    roots = [with_hint(sub) for sub in roots]
+    if sequential:
+        # Depth-first, A before B
+        stack = list(reversed(roots))
+        while len(stack) > 0:
+            sub = stack.pop()
+            if start(sub):
+                allot(sub, weight(sub) + sum(weight(s) for s in stack))
+                stack.extend(reversed(split(sub, *_timed_bisect(sub, strong_weights, edge_weights))))
+        return block_names, block_statuses
+
+    # Each worker opens its own connection to the partition cache
+    cache_args = None if _partition_cache is None else (_partition_cache.path, _partition_cache.max_size)
+    initargs = (strong_weights, edge_weights, cache_args)
+    with ProcessPoolExecutor(n_jobs, initializer=_init_worker, initargs=initargs) as pool:
+        running = {}
+
+        def submit(subs: list[Subproblem]):
+            subs = [sub for sub in subs if start(sub)]
+            pending_weight = sum(weight(s) for s in running.values()) + sum(weight(s) for s in subs)
+            for sub in subs:
+                running[pool.submit(_timed_bisect, allot(sub, pending_weight))] = sub
+
+        submit(roots)
+        while len(running) > 0:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            # Handle finished bisections in a fixed order so the log is easier to follow
+            for future in sorted(done, key=lambda f: running[f].name):
+                sub = running.pop(future)
+                submit(split(sub, *future.result()))
+    return block_names, block_statuses
 
 
 # This function was extracted from a Jupyter notebook.
-def cluster_dataset(ds: Dataset) -> pd.DataFrame:
+# Independent bisections are solved by a pool of `n_jobs` processes. Pass the result of a previous run as
+# `previous` to use its blocks as hints. The bisections share a `time_budget` (in seconds) and the
+# "block_status" column records how each block was found (see `STATUSES`). CP-SAT is configured by
+# `solver_params` and the stats of every bisection end up in `attrs["solver_stats"]`.
+def cluster_dataset(
+    ds: Dataset,
+    n_jobs: int | None = None,
+    previous: pd.DataFrame | None = None,
+    time_budget: float | None = None,
+    solver_params: ilp.SolverParams | None = None,
+) -> pd.DataFrame:
+    # The time spent in each stage (in seconds)
+    timings = {}
+
     # ...
     entities_df = ds.entities_df()
-    edges = oset((r["src_id"], r["tgt_id"]) for _, r in ds.deps_df().iterrows())
+    edges = ds.dep_edges()
 
     # Create a text similarity thing (may not even use it)
-    similarity = NameSimilarity(list(ds.targets_df["name"]), allow_dup_names=ALLOW_DUP_NAMES, lookback=TEXT_SIM_LOOKBACK)
+    with _timed(timings, "similarity"):
+        similarity = NameSimilarity(
+            list(ds.targets_df["name"]),
+            allow_dup_names=ALLOW_DUP_NAMES,
+            lookback=TEXT_SIM_LOOKBACK,
+            min_sim=TEXT_EDGE_MIN_SIM if SPARSE_TEXT_SIM else None,
+        )
 
     if USE_INIT_TEXT_CLX:
         # Cluster by name
@@ -123,95 +617,77 @@ def cluster_dataset(ds: Dataset) -> pd.DataFrame:
         # Create a "name_id" for each entity that groups targets according to their name
         entities_df["name_id"] = entities_df.groupby("name").ngroup()
 
-    # Create a "strong_id" for each entity that groups targets according the strongly connected componant of their name
-    name_edges = group_edges_by(edges, entities_df["name_id"])
-    entities_df["strong_id"] = group_by_scc(entities_df["name_id"], name_edges)
+    with _timed(timings, "grouping"):
+        # Create a "strong_id" for each entity that groups targets according the strongly connected componant of their name
+        name_edges = edges.relabel(entities_df["name_id"])
+        entities_df["strong_id"] = group_by_scc(entities_df["name_id"], name_edges)
 
-    # Create a "weak_id" for each entity that groups targets according the weakly connected componant of their strong_id
-    strong_edges = group_edges_by(edges, entities_df["strong_id"])
-    entities_df["weak_id"] = group_by_wcc(entities_df["strong_id"], strong_edges)
-
-    # ...
-    txt_edge_weights = build_txt_edges(entities_df, similarity)
-    txt_edges = set(txt_edge_weights.keys())
+        # Create a "weak_id" for each entity that groups targets according the weakly connected componant of their strong_id
+        strong_edges = edges.relabel(entities_df["strong_id"]).unique()
+        entities_df["weak_id"] = group_by_wcc(entities_df["strong_id"], strong_edges)
 
     # ...
-    def get_entity_weight(id: int) -> int:
-        kind = entities_df.loc[id]["kind"]
-        return 0 if kind == "file" else 1
-
-    def get_strong_weight(strong_id: int) -> int:
-        ids = entities_df[entities_df["strong_id"] == strong_id].index
-        return sum(get_entity_weight(id) for id in ids)
-
-    def get_edge_weight(a_strong_id: int, b_strong_id: int) -> int:
-        weight = 0
-        key = (a_strong_id, b_strong_id)
-        if key in strong_edges:
-            weight += UNIT_EDGE_WEIGTH
-        if USE_TEXT_EDGES and key in txt_edges:
-            weight += round(txt_edge_weights[key] * UNIT_EDGE_WEIGTH * TEXT_EDGE_MULTIPLIER)
-        return weight
-
-    def cluster(dep_edges: set[tuple[int, int]], txt_edges: set[tuple[int, int]], active: set[int], name: str) -> dict[int, str]:
-        active_dep_edges = set((a, b) for a, b in dep_edges if a in active and b in active)
-        active_txt_edges = set((a, b) for a, b in txt_edges if a in active and b in active)
-        
-        # Print info
-        active_edges = active_dep_edges | active_txt_edges
-        density = len(active_edges) / len(active)
-        timestamp = time.strftime("%H:%M:%S", time.localtime())
-        prefix = f"[{name}]".ljust(18) + f" ({timestamp})   "
-        info = f"{len(active_edges)} edges and {len(active)} nodes = {density:0.4f} density"
-        print(prefix + f"Starting... ({info})", end="\t")
-
-        default_res = {i: name for i in active}
-
-        if sum(get_strong_weight(strong_id) for strong_id in active) <= MAX_WEIGHT:
-            print("Aborted. Weight under threshold.")
-            return default_res
-
-        def w(strong_id: int) -> int:
-            if strong_id not in active:
-                return 0
-            return get_strong_weight(strong_id)
-
-        # There are two ways to use `active`:
-        # 1) Use ILP to bisect only the active elements
-        #    - This might be faster.
-        # 2) Use ILP to bisect all elements, but non-active elements are weighted to 0
-        #    - This might produce better results.
-        if USE_ALL:
-            active_dep_edges = dep_edges
-            active_txt_edges = txt_edges
-
-        start = time.perf_counter()
-        if USE_TEXT_EDGES:
-            cut_weight, labels = ilp.partition2(active_dep_edges, active_txt_edges, w, get_edge_weight, 2, CUT_EPS, 120)
-        else:
-            cut_weight, labels = ilp.partition(list(active_dep_edges), w, lambda i, j: 1, 2, CUT_EPS)
-        if labels is None:
-            print("Aborted. Failed to partition.")
-            return default_res
-        elapsed = time.perf_counter() - start
-        print(f"Bisected with a cut weight of {cut_weight} in {elapsed:0.4f} secs.")
-
-        active_A = active & {i for i, l in labels.items() if l == 0}
-        active_B = active & {i for i, l in labels.items() if l == 1}
-        res_A = cluster(dep_edges, txt_edges, active_A, name + "A")
-        res_B = cluster(dep_edges, txt_edges, active_B, name + "B")
-        return res_A | res_B
-    
-    # ...
-    block_names = {}
-
-    for weak_id in range(entities_df["weak_id"].max() + 1):
+    with _timed(timings, "text_edges"):
+        txt_edge_weights = build_txt_edges(entities_df, similarity)
+        txt_edges = Edges.from_pairs(txt_edge_weights.keys(), "text")
+
+    # Look up every node and edge weight once (they are read by every recursive call)
+    with _timed(timings, "weights"):
+        strong_weights = to_strong_weights(entities_df)
+        edge_weights = to_edge_weights(zip(strong_edges.src.tolist(), strong_edges.tgt.tolist()), txt_edge_weights)
+
+    # Bisect each weakly connected component (wcc) recursively
+    dep_edges = Edges(strong_edges.src, strong_edges.tgt, np.full(len(strong_edges), "dep", dtype=object))
+    all_edges = Edges.concat([dep_edges, txt_edges])
+    # Sort the edges inside a wcc by the wcc (keeping their order otherwise) so that each wcc is a slice
+    weak_ids = entities_df.groupby("strong_id")["weak_id"].first()
+    weak_edges = all_edges.relabel(weak_ids)
+    inside = np.flatnonzero(weak_edges.src == weak_edges.tgt)
+    order = inside[np.argsort(weak_edges.src[inside], kind="stable")]
+    n_weak = entities_df["weak_id"].max() + 1
+    bounds = np.searchsorted(weak_edges.src[order], np.arange(n_weak + 1))
+    strong_ids_by_weak = entities_df.groupby("weak_id")["strong_id"].unique()
+    roots = []
+    for weak_id in range(n_weak):
         # The strong_ids inside the current weakly connected component (wcc)
-        wcc_nodes = set(entities_df[entities_df["weak_id"] == weak_id]["strong_id"])
-        wcc_dep_edges = {(a, b) for a, b in strong_edges if a in wcc_nodes and b in wcc_nodes}
-        wcc_txt_edges = {(a, b) for a, b in txt_edges if a in wcc_nodes and b in wcc_nodes}
-        block_names |= cluster(wcc_dep_edges, wcc_txt_edges, wcc_nodes, name=f"W{weak_id}")
+        wcc_nodes = set(strong_ids_by_weak[weak_id].tolist())
+        wcc_edges = all_edges[order[bounds[weak_id] : bounds[weak_id + 1]]]
+        roots.append(Subproblem(f"W{weak_id}", wcc_edges, wcc_nodes))
+    n_jobs = N_JOBS if n_jobs is None else n_jobs
+    prev_block_names = None if previous is None else to_previous_block_names(entities_df, previous)
+    time_budget = TIME_BUDGET if time_budget is None else time_budget
+    # By default, the jobs split the cores between them
+    solver_params = SOLVER_PARAMS if solver_params is None else solver_params
+    if solver_params.num_workers == 0 and n_jobs > 1:
+        solver_params = replace(solver_params, num_workers=max(1, (os.cpu_count() or 1) // n_jobs))
+    depth_stats = {}
+    solver_stats = []
+    with _timed(timings, "clustering"):
+        block_names, block_statuses = schedule(
+            roots,
+            strong_weights,
+            edge_weights,
+            n_jobs,
+            timings,
+            prev_block_names,
+            time_budget,
+            depth_stats,
+            solver_params,
+            solver_stats,
+        )
+    for depth, level in sorted(depth_stats.items()):
+        print(
+            f"Depth {depth}: {level.bisections} bisections of {level.nodes} nodes and {level.edges} edges "
+            f"(solved as {level.model_nodes} nodes and {level.model_edges} edges) in {level.wall_time:0.4f} secs"
+        )
 
     entities_df["block_name"] = [block_names.get(i) for i in entities_df["strong_id"]]
+    entities_df["block_status"] = [block_statuses.get(i) for i in entities_df["strong_id"]]
     entities_df["block_id"] = entities_df.groupby("block_name").ngroup()
+
+    print("Timings: " + ", ".join(f"{stage} {secs:0.4f} secs" for stage, secs in timings.items()))
+    entities_df.attrs["timings"] = timings
+    entities_df.attrs["depth_stats"] = depth_stats
+    # One row per bisection (see `ilp.SolveStats`)
+    entities_df.attrs["solver_stats"] = pd.DataFrame(solver_stats)
     return entities_df
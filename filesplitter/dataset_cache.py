@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import shutil
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# Bump this whenever the layout of an entry changes so that old entries are no longer found
+FORMAT_VERSION = 1
+
+
+@dataclass
+class DatasetCacheInfo:
+    hits: int
+    misses: int
+    entries: int
+    size: int
+    max_size: int
+
+
+def dataset_key(db_path: str, filename: str, ref_name: str) -> str:
+    "Hashes the database (by its path, size and modification time), the file and the ref a dataset is loaded from."
+    stat = os.stat(db_path)
+    parts = [FORMAT_VERSION, os.path.abspath(db_path), stat.st_size, stat.st_mtime_ns, filename, ref_name]
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+
+def _save_frame(entry_dir: str, name: str, df: pd.DataFrame) -> dict:
+    "Saves each column (and the index, if it is named) to its own .npy file."
+    index = df.index.name
+    df = df.reset_index(drop=index is None)
+    columns = []
+    for i, (col_name, col) in enumerate(df.items()):
+        path = os.path.join(entry_dir, f"{name}.{i}.npy")
+        if col.dtype == object:
+            # Can't be memory mapped, but these are rare (e.g. the parent_id of clients, which are all NULL)
+            np.save(path, col.to_numpy(), allow_pickle=True)
+        elif isinstance(col.dtype, pd.StringDtype):
+            np.save(path, col.fillna("").to_numpy(dtype=str))
+            np.save(os.path.join(entry_dir, f"{name}.{i}.na.npy"), col.isna().to_numpy())
+        else:
+            np.save(path, col.to_numpy())
+        columns.append({"name": col_name, "dtype": str(col.dtype)})
+    return {"index": index, "columns": columns}
+
+
+def _load_frame(entry_dir: str, name: str, meta: dict) -> pd.DataFrame:
+    data = {}
+    for i, col in enumerate(meta["columns"]):
+        path = os.path.join(entry_dir, f"{name}.{i}.npy")
+        na_path = os.path.join(entry_dir, f"{name}.{i}.na.npy")
+        if col["dtype"] == "object":
+            data[col["name"]] = pd.Series(np.load(path, allow_pickle=True), dtype=object)
+        elif os.path.exists(na_path):
+            values = np.load(path).astype(object)
+            values[np.load(na_path)] = None
+            data[col["name"]] = pd.Series(values, dtype=col["dtype"])
+        else:
+            # Copy-on-write, so that cached datasets can be modified like freshly loaded ones (but not the file)
+            data[col["name"]] = pd.Series(np.load(path, mmap_mode="c"), dtype=col["dtype"], copy=False)
+    df = pd.DataFrame(data, copy=False)
+    return df if meta["index"] is None else df.set_index(meta["index"])
+
+
+class DatasetCache:
+    """Stores loaded datasets in a directory, one subdirectory per key (see `dataset_key`) with a .npy file per
+    column. Numeric columns are memory mapped (copy-on-write) when read back. Once the entries take up more than
+    `max_size` bytes, the least recently used ones are evicted."""
+
+    def __init__(self, path: str, max_size: int = 2**30):
+        self.path = path
+        self.max_size = max_size
+        self._hits = 0
+        self._misses = 0
+        os.makedirs(path, exist_ok=True)
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.path, key)
+
+    def _entries(self) -> list[tuple[str, dict]]:
+        entries = []
+        for key in os.listdir(self.path):
+            meta_path = os.path.join(self._entry_dir(key), "meta.json")
+            if os.path.exists(meta_path):
+                with open(meta_path) as f:
+                    entries.append((key, json.load(f) | {"used_at": os.path.getmtime(meta_path)}))
+        return entries
+
+    def get(self, key: str) -> dict | None:
+        "Returns the fields of the dataset stored under the key (if any)."
+        entry_dir = self._entry_dir(key)
+        meta_path = os.path.join(entry_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            self._misses += 1
+            return None
+        self._hits += 1
+        os.utime(meta_path)
+        with open(meta_path) as f:
+            meta = json.load(f)
+        fields = {name: _load_frame(entry_dir, name, m) for name, m in meta["frames"].items()}
+        return fields | meta["values"]
+
+    def put(self, key: str, fields: dict, db_path: str):
+        """Stores the fields of a dataset (data frames or JSON values). The entry is written to a temporary
+        directory first so that readers never see half of one."""
+        tmp_dir = self._entry_dir(f"{key}.{os.getpid()}.tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        meta = {"db_path": os.path.abspath(db_path), "frames": {}, "values": {}}
+        for name, value in fields.items():
+            if isinstance(value, pd.DataFrame):
+                meta["frames"][name] = _save_frame(tmp_dir, name, value)
+            else:
+                meta["values"][name] = value
+        meta["size"] = sum(e.stat().st_size for e in os.scandir(tmp_dir))
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+        try:
+            os.replace(tmp_dir, self._entry_dir(key))
+        except OSError:
+            # Another process stored the same dataset first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self._evict()
+
+    def _evict(self):
+        entries = self._entries()
+        excess = sum(meta["size"] for _, meta in entries) - self.max_size
+        # Walk from least to most recently used until enough has been freed
+        for key, meta in sorted(entries, key=lambda e: e[1]["used_at"]):
+            if excess <= 0:
+                break
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            excess -= meta["size"]
+
+    def invalidate(self, db_path: str):
+        "Removes every dataset that was loaded from the database."
+        for key, meta in self._entries():
+            if meta["db_path"] == os.path.abspath(db_path):
+                shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def cache_clear(self):
+        for key, _ in self._entries():
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+        self._hits = self._misses = 0
+
+    def cache_info(self) -> DatasetCacheInfo:
+        entries = self._entries()
+        size = sum(meta["size"] for _, meta in entries)
+        return DatasetCacheInfo(self._hits, self._misses, len(entries), size, self.max_size)
@@ -1,6 +1,11 @@
-import inspect
 import sqlite3
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Callable
+from urllib.parse import quote
 
 import pandas as pd
 
@@ -8,63 +13,265 @@ Con = sqlite3.Connection
 
 QUERIES_PATH = Path(__file__).absolute().parent.joinpath("queries")
 
+# Bump this whenever _prepare.sql changes so that previously prepared tables get rebuilt
+PREPARED_VERSION = 1
+
+
+@dataclass(frozen=True)
+class ConnectionProfile:
+    """How `connect` opens a database, which has to exist already (even if the connection isn't read-only).
+    Read-only connections can still write temp tables and attached sidecars. Only mark a database `immutable`
+    if nothing will write to it while it's open (SQLite then skips locking and change detection altogether)."""
+
+    read_only: bool = True
+    immutable: bool = False
+    # The number of bytes to memory map (0 turns it off)
+    mmap_size: int = 2**30
+    # The size of the page cache, in pages if positive or in KiB if negative
+    cache_size: int = -(2**18)
+    # Where temp tables and indexes are kept ("DEFAULT", "FILE" or "MEMORY")
+    temp_store: str = "MEMORY"
+
+
+# What a plain `sqlite3.connect` gives you (for comparison)
+PLAIN_PROFILE = ConnectionProfile(read_only=False, mmap_size=0, cache_size=-2000, temp_store="DEFAULT")
+
+# The profile `connect` uses by default
+CONNECTION_PROFILE = ConnectionProfile()
+
+
+def connect(db_path: str, profile: ConnectionProfile | None = None) -> Con:
+    profile = CONNECTION_PROFILE if profile is None else profile
+    uri = f"file:{quote(str(Path(db_path).absolute()))}?mode={'ro' if profile.read_only else 'rw'}"
+    if profile.immutable:
+        uri += "&immutable=1"
+    con = sqlite3.connect(uri, uri=True)
+    con.execute(f"PRAGMA mmap_size = {int(profile.mmap_size)}")
+    con.execute(f"PRAGMA cache_size = {int(profile.cache_size)}")
+    con.execute(f"PRAGMA temp_store = {profile.temp_store}")
+    return con
+
+
+@dataclass
+class QueryStats:
+    calls: int = 0
+    seconds: float = 0.0
+
+
+_queries: dict[str, str] = {}
+_query_stats: dict[str, QueryStats] = defaultdict(QueryStats)
+
+
+def _load_queries() -> dict[str, str]:
+    "Reads all of the queries (once) and checks that none are empty."
+    if not _queries:
+        for path in sorted(QUERIES_PATH.glob("*.sql")):
+            sql = path.read_text()
+            if sql.strip() == "":
+                raise RuntimeError(f"The query '{path.name}' is empty")
+            _queries[path.stem] = sql
+    return _queries
+
+
+def queries() -> dict[str, str]:
+    "Returns the SQL of every query by name, including the scripts (whose names start with an underscore)."
+    return dict(_load_queries())
+
 
 def _get_query(query_name: str) -> str:
-    return QUERIES_PATH.joinpath(f"{query_name}.sql").read_text()
+    queries = _load_queries()
+    if query_name not in queries:
+        raise RuntimeError(f"No query named '{query_name}' found in {QUERIES_PATH}")
+    return queries[query_name]
+
+
+@contextmanager
+def _timed(query_name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = _query_stats[query_name]
+        stats.calls += 1
+        stats.seconds += time.perf_counter() - start
+
+
+def _read_sql(query_name: str, con: Con, **kwargs) -> pd.DataFrame:
+    sql = _get_query(query_name)
+    with _timed(query_name):
+        return pd.read_sql(sql, con, **kwargs)
+
+
+def query_stats() -> pd.DataFrame:
+    "Returns how many times each query ran (in this process) and how long it took, slowest first."
+    rows = [(name, s.calls, s.seconds, s.seconds / s.calls) for name, s in _query_stats.items()]
+    df = pd.DataFrame(rows, columns=["query", "calls", "seconds", "mean_seconds"]).set_index("query")
+    return df.sort_values("seconds", ascending=False)
+
+
+def reset_query_stats():
+    _query_stats.clear()
+
+
+def create_temp_tables(con: Con, prepared_schema: str | None = None):
+    """Creates the temp tables the queries rely on. If `prepared_schema` is given, the tables materialized in
+    that schema (see `prepare_tables`) are used instead, after (re)building them if they are missing or stale."""
+    if prepared_schema is None:
+        with _timed("_prelude"):
+            con.executescript(_get_query("_prelude"))
+        return
+    if prepared_fingerprint(con, prepared_schema) != fingerprint(con):
+        prepare_tables(con, prepared_schema)
+    with _timed("_use_prepared"):
+        con.executescript(_get_query("_use_prepared").format(schema=prepared_schema))
 
 
-def _get_query_by_caller_name() -> str:
-    func_name = inspect.stack()[1][3]
-    return _get_query(func_name)
+def create_scoped_temp_tables(con: Con, file_id: int):
+    """Creates `temp.filenames` for just the subtree of a file and the sources of the dependencies on it, which
+    is all that the queries of `loading.load_dataset` need (but not enough for `fetch_candidate_files`)."""
+    with _timed("_scoped_prelude"):
+        con.execute(_get_query("_scoped_prelude"), {"file_id": file_id})
 
 
-def create_temp_tables(con: Con):
-    con.executescript(_get_query("_prelude"))
+def fingerprint(con: Con) -> str:
+    "Summarizes the entities table (which is all the prelude tables depend on)."
+    count, max_id, total_parent_id = con.execute(
+        "SELECT COUNT(*), MAX(id), TOTAL(parent_id) FROM main.entities"
+    ).fetchone()
+    return f"v{PREPARED_VERSION}:{count}:{max_id}:{total_parent_id}"
+
+
+def prepared_fingerprint(con: Con, schema: str) -> str | None:
+    "Returns the fingerprint of the tables prepared in the schema (or None if there are none)."
+    try:
+        row = con.execute(f"SELECT value FROM {schema}.fs_meta WHERE key = 'fingerprint'").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return None if row is None else row[0]
+
+
+def prepare_tables(con: Con, schema: str = "main"):
+    "Materializes (and indexes) the prelude tables in the schema, which is either main or an attached database."
+    with _timed("_prepare"):
+        con.executescript(_get_query("_prepare").format(schema=schema))
+    with con:
+        con.execute(f"INSERT INTO {schema}.fs_meta VALUES ('fingerprint', ?)", (fingerprint(con),))
+
+
+def update_churn(con: Con, schema: str):
+    """Folds the changes of commits that are new since the last call into the per-file churn and author tables
+    kept in the schema (and exposes them as temp views for `fetch_ref_candidate_files`). Assumes commits are
+    only ever appended (with increasing ids) and that `temp.filenames` exists."""
+    with _timed("_update_churn"):
+        con.executescript(_get_query("_update_churn").format(schema=schema))
 
 
 def fetch_candidate_files(con: Con, ref_name: str, min_locs: int, min_authors: int) -> pd.DataFrame:
     params = {"ref_name": ref_name, "min_locs": min_locs, "min_authors": min_authors}
-    return pd.read_sql(_get_query_by_caller_name(), con, params=params)
+    return _read_sql("fetch_candidate_files", con, params=params)
+
+
+def fetch_ref_candidate_files(con: Con, ref_name: str, min_locs: int, min_authors: int) -> pd.DataFrame:
+    "Like `fetch_candidate_files`, but only looks at the commits of the ref (and needs `update_churn` first)."
+    params = {"ref_name": ref_name, "min_locs": min_locs, "min_authors": min_authors}
+    return _read_sql("fetch_ref_candidate_files", con, params=params)
 
 
 def fetch_children(con: Con, ref_name: str, target_id: int) -> pd.DataFrame:
     params = {"ref_name": ref_name, "target_id": str(target_id)}
-    return pd.read_sql(_get_query_by_caller_name(), con, index_col="id", params=params)
+    return _read_sql("fetch_children", con, index_col="id", params=params)
 
 
 def fetch_client_deps(con: Con, target_id: int, target_file: str) -> pd.DataFrame:
     params = {"target_id": str(target_id), "target_file": target_file}
-    return pd.read_sql(_get_query_by_caller_name(), con, params=params)
+    return _read_sql("fetch_client_deps", con, params=params)
 
 
 def fetch_clients(con: Con, target_file: str) -> pd.DataFrame:
     params = {"target_file": target_file}
-    return pd.read_sql(_get_query_by_caller_name(), con, index_col="id", params=params)
+    return _read_sql("fetch_clients", con, index_col="id", params=params)
 
 
 def fetch_entities_by_name(con: Con, name: str) -> pd.DataFrame:
     params = {"name": name}
-    return pd.read_sql(_get_query_by_caller_name(), con, params=params)
+    return _read_sql("fetch_entities_by_name", con, params=params)
 
 
 def fetch_internal_deps(con: Con, target_id: int) -> pd.DataFrame:
     params = {"target_id": str(target_id)}
-    return pd.read_sql(_get_query_by_caller_name(), con, params=params)
+    return _read_sql("fetch_internal_deps", con, params=params)
 
 
 def fetch_outgoing_type_names(con: Con, target_id: int) -> list[str]:
     params = {"target_id": str(target_id)}
-    return list(pd.read_sql(_get_query_by_caller_name(), con, params=params)["name"])
+    return list(_read_sql("fetch_outgoing_type_names", con, params=params)["name"])
 
 
 def fetch_refs(con: Con) -> pd.DataFrame:
-    return pd.read_sql(_get_query_by_caller_name(), con)
+    return _read_sql("fetch_refs", con)
 
 
 def fetch_touches(con: Con, ref_name: str, target_id: str) -> pd.DataFrame:
     params = {"ref_name": ref_name, "target_id": str(target_id)}
-    return pd.read_sql(_get_query_by_caller_name(), con, params=params)
+    return _read_sql("fetch_touches", con, params=params)
 
 
 def fetch_lead_ref_name(con: Con) -> str:
     return fetch_refs(con).iloc[0]["name"]
+
+
+def set_batch_targets(con: Con, targets: list[tuple[str, int | None]]):
+    "Fills `temp.batch_targets` with the (filename, top_id) pairs that the fetch_batch_* queries run over."
+    con.execute("CREATE TEMP TABLE IF NOT EXISTS batch_targets (filename TEXT NOT NULL, top_id INTEGER)")
+    con.execute("DELETE FROM temp.batch_targets")
+    con.executemany("INSERT INTO temp.batch_targets VALUES (?, ?)", targets)
+
+
+def fetch_batch_files(con: Con) -> pd.DataFrame:
+    return _read_sql("fetch_batch_files", con)
+
+
+def fetch_batch_children(con: Con, ref_name: str) -> pd.DataFrame:
+    return _read_sql("fetch_batch_children", con, params={"ref_name": ref_name})
+
+
+def fetch_batch_client_deps(con: Con) -> pd.DataFrame:
+    return _read_sql("fetch_batch_client_deps", con)
+
+
+def fetch_batch_clients(con: Con) -> pd.DataFrame:
+    return _read_sql("fetch_batch_clients", con)
+
+
+def fetch_batch_internal_deps(con: Con) -> pd.DataFrame:
+    return _read_sql("fetch_batch_internal_deps", con)
+
+
+def fetch_batch_outgoing_type_names(con: Con) -> pd.DataFrame:
+    return _read_sql("fetch_batch_outgoing_type_names", con)
+
+
+def fetch_batch_touches(con: Con, ref_name: str) -> pd.DataFrame:
+    return _read_sql("fetch_batch_touches", con, params={"ref_name": ref_name})
+
+
+# The fetch function that runs each query (every query but the scripts)
+FETCH_FUNCTIONS: dict[str, Callable[..., object]] = {
+    "fetch_candidate_files": fetch_candidate_files,
+    "fetch_ref_candidate_files": fetch_ref_candidate_files,
+    "fetch_children": fetch_children,
+    "fetch_client_deps": fetch_client_deps,
+    "fetch_clients": fetch_clients,
+    "fetch_entities_by_name": fetch_entities_by_name,
+    "fetch_internal_deps": fetch_internal_deps,
+    "fetch_outgoing_type_names": fetch_outgoing_type_names,
+    "fetch_refs": fetch_refs,
+    "fetch_touches": fetch_touches,
+    "fetch_batch_files": fetch_batch_files,
+    "fetch_batch_children": fetch_batch_children,
+    "fetch_batch_client_deps": fetch_batch_client_deps,
+    "fetch_batch_clients": fetch_batch_clients,
+    "fetch_batch_internal_deps": fetch_batch_internal_deps,
+    "fetch_batch_outgoing_type_names": fetch_batch_outgoing_type_names,
+    "fetch_batch_touches": fetch_batch_touches,
+}
@@ -1,14 +1,118 @@
+from dataclasses import dataclass
 from typing import Iterable, Callable
 
 import numpy as np
 import pandas as pd
 from ordered_set import OrderedSet as oset
-from scipy.sparse import csr_matrix
+from scipy.sparse import coo_matrix, csr_matrix
 from scipy.sparse.csgraph import connected_components
 
 
+@dataclass(frozen=True)
+class Edges:
+    """A list of edges stored as columns. The `kind` of each edge is a label such as the kind of a dependency
+    (or "dep" and "text" in `clustering`). Select edges by indexing with a boolean mask."""
+
+    src: np.ndarray
+    tgt: np.ndarray
+    kind: np.ndarray
+
+    @staticmethod
+    def from_pairs(pairs: Iterable[tuple[int, int]], kind: str) -> "Edges":
+        arr = to_edge_array(pairs)
+        return Edges(arr[:, 0], arr[:, 1], np.full(len(arr), kind, dtype=object))
+
+    @staticmethod
+    def concat(edges: list["Edges"]) -> "Edges":
+        return Edges(
+            np.concatenate([e.src for e in edges]),
+            np.concatenate([e.tgt for e in edges]),
+            np.concatenate([e.kind for e in edges]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.src)
+
+    def __getitem__(self, key: np.ndarray) -> "Edges":
+        return Edges(self.src[key], self.tgt[key], self.kind[key])
+
+    def pairs(self) -> set[tuple[int, int]]:
+        return set(zip(self.src.tolist(), self.tgt.tolist()))
+
+    def nodes(self) -> np.ndarray:
+        return np.unique(np.concatenate([self.src, self.tgt]))
+
+    def keys(self) -> np.ndarray:
+        return pack_pairs(self.src, self.tgt)
+
+    def within(self, nodes: np.ndarray) -> np.ndarray:
+        "Selects the edges between the given nodes."
+        if len(self) == 0 or min(self.src.min(), self.tgt.min()) < 0:
+            return np.isin(self.src, nodes) & np.isin(self.tgt, nodes)
+        # Look up the (non-negative) endpoints in a table rather than searching for them
+        size = max(self.src.max(), self.tgt.max()) + 1
+        flags = np.zeros(size, dtype=bool)
+        flags[nodes[(nodes >= 0) & (nodes < size)]] = True
+        return flags[self.src] & flags[self.tgt]
+
+    def relabel(self, col: pd.Series) -> "Edges":
+        "Replaces each endpoint with its value in `col` (which is indexed by node)."
+        return Edges(col.loc[self.src].to_numpy(), col.loc[self.tgt].to_numpy(), self.kind)
+
+    def unique(self) -> "Edges":
+        "Removes repeated (src, tgt) pairs, keeping the first one."
+        if len(self) == 0:
+            return self
+        _, first = np.unique(self.keys(), return_index=True)
+        return self[np.sort(first)]
+
+
+def pack_pairs(src: np.ndarray, tgt: np.ndarray) -> np.ndarray:
+    "Packs each (src, tgt) pair of 32-bit ids into a single integer (for fast set operations)."
+    return (src.astype(np.int64) << 32) | (tgt.astype(np.int64) & 0xFFFFFFFF)
+
+
+def unpack_pairs(keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    return keys >> 32, (keys & 0xFFFFFFFF).astype(np.uint32).view(np.int32).astype(np.int64)
+
+
+def to_edge_array(edges: Iterable[tuple[int, int]]) -> np.ndarray:
+    "Packs the edges into an (n_edges, 2) array of integers."
+    if isinstance(edges, Edges):
+        return np.column_stack([edges.src, edges.tgt])
+    if isinstance(edges, np.ndarray):
+        return edges.reshape(-1, 2)
+    return np.array(list(edges), dtype=np.int64).reshape(-1, 2)
+
+
+def to_edge_oset(arr: np.ndarray) -> oset[tuple[int, int]]:
+    "Unpacks an edge array into an ordered set of edges (keeping the first of any duplicates)."
+    if len(arr) == 0:
+        return oset()
+    _, first = np.unique(arr, axis=0, return_index=True)
+    return oset(map(tuple, arr[np.sort(first)].tolist()))
+
+
+def unique_in_order(seq: Iterable[int]) -> np.ndarray:
+    "Like `oset(seq)`, but as an array."
+    arr = np.asarray(seq)
+    _, first = np.unique(arr, return_index=True)
+    return arr[np.sort(first)]
+
+
+def index_of(nodes: np.ndarray, values: np.ndarray) -> np.ndarray:
+    "Finds the position of each value in `nodes` (like `nodes.index` on an oset, but for many values at once)."
+    sorter = np.argsort(nodes, kind="stable")
+    pos = np.searchsorted(nodes, values, sorter=sorter)
+    ixs = sorter[np.minimum(pos, len(nodes) - 1)] if len(nodes) > 0 else pos
+    if len(values) > 0 and (len(nodes) == 0 or np.any(nodes[ixs] != values)):
+        raise ValueError("some values are not nodes")
+    return ixs
+
+
 def no_loops(edges: oset[tuple[int, int]]) -> oset[tuple[int, int]]:
-    return oset((a, b) for a, b in edges if a != b)
+    arr = to_edge_array(edges)
+    return to_edge_oset(arr[arr[:, 0] != arr[:, 1]])
 
 
 def map_edges(edges: oset[tuple[int, int]], f: Callable[[int], int]) -> oset[tuple[int, int]]:
@@ -16,39 +120,37 @@ def map_edges(edges: oset[tuple[int, int]], f: Callable[[int], int]) -> oset[tup
 
 
 def group_edges_by(edges: oset[tuple[int, int]], col: pd.Series) -> oset[tuple[int, int]]:
-    return map_edges(edges, lambda x: col.loc[x])
+    arr = to_edge_array(edges)
+    return to_edge_oset(col.loc[arr.ravel()].to_numpy().reshape(-1, 2))
 
 
-def to_adj(nodes: oset[int], edges: oset[tuple[int, int]]) -> np.ndarray:
-    arr = np.zeros((len(nodes), len(nodes)))
-    for src, tgt in edges:
-        src_ix = nodes.index(src)
-        tgt_ix = nodes.index(tgt)
-        arr[src_ix, tgt_ix] = 1.0
-    return arr
+def to_adj(nodes: np.ndarray, edges: Iterable[tuple[int, int]]) -> csr_matrix:
+    arr = index_of(nodes, to_edge_array(edges).ravel()).reshape(-1, 2)
+    data = np.ones(len(arr))
+    return coo_matrix((data, (arr[:, 0], arr[:, 1])), shape=(len(nodes), len(nodes))).tocsr()
 
 
-def to_sc_components(adj: np.ndarray) -> list[int]:
+def to_sc_components(adj: csr_matrix) -> np.ndarray:
     _, labels = connected_components(
         csr_matrix(adj), connection="strong", directed=True, return_labels=True
     )
-    return list(labels)
+    return labels
 
 
-def to_wc_components(adj: np.ndarray) -> list[int]:
+def to_wc_components(adj: csr_matrix) -> np.ndarray:
     _, labels = connected_components(
         csr_matrix(adj), connection="weak", directed=True, return_labels=True
     )
-    return list(labels)
+    return labels
 
 
 def group_by_scc(seq: Iterable[int], edges: oset[tuple[int, int]]) -> list[int]:
-    nodes = oset(seq)
+    nodes = unique_in_order(seq)
     comp_labels = to_sc_components(to_adj(nodes, edges))
-    return [comp_labels[nodes.index(e)] for e in seq]
+    return list(comp_labels[index_of(nodes, np.asarray(seq))])
 
 
 def group_by_wcc(seq: Iterable[int], edges: oset[tuple[int, int]]) -> list[int]:
-    nodes = oset(seq)
+    nodes = unique_in_order(seq)
     comp_labels = to_wc_components(to_adj(nodes, edges))
-    return [comp_labels[nodes.index(e)] for e in seq]
\ No newline at end of file
+    return list(comp_labels[index_of(nodes, np.asarray(seq))])
@@ -0,0 +1,347 @@
+import heapq
+import time
+from math import ceil, inf
+from typing import Callable, Mapping
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components, laplacian
+from scipy.sparse.linalg import ArpackNoConvergence, eigsh
+
+from filesplitter import ilp
+
+# Every partitioner has the same signature as `ilp.partition2` (without the `callback`, and only the exact
+# solver uses the `params`)
+Partitioner = Callable[..., tuple[float, dict[int, int] | None, ilp.SolveStats]]
+
+# Subproblems with at most this many nodes are always solved exactly by the "auto" policy
+EXACT_MAX_NODES = 150
+
+# Subproblems with more than this many nodes (or edges) only get a heuristic solution from the "auto" policy
+HEURISTIC_MIN_NODES = 1000
+HEURISTIC_MIN_EDGES = 8000
+
+# Refinement stops after this many passes or this many moves without an improvement (in one pass)
+FM_MAX_PASSES = 8
+FM_MAX_FRUITLESS_MOVES = 200
+
+# The largest graph whose Fiedler vector is found with a dense eigensolver
+DENSE_EIGH_MAX_NODES = 1500
+
+
+class _Graph:
+    """A bisection problem over the strongly connected components of the directed edges (nodes in the same
+    component must end up in the same part, so they are contracted.)"""
+
+    def __init__(
+        self,
+        di_edges: set[tuple[int, int]],
+        un_edges: set[tuple[int, int]],
+        node_weight: Callable[[int], int] | Mapping[int, int],
+        edge_weight: Callable[[int, int], int] | Mapping[tuple[int, int], int],
+        eps: float,
+    ):
+        node_weight, edge_weight = ilp.as_weight_fns(node_weight, edge_weight)
+
+        # Same preprocessing as `ilp.partition2`
+        di_edges = {(a, b) for a, b in di_edges if a != b}
+        un_edges = {(a, b) for a, b in un_edges if a != b} - di_edges
+        edges = list(sorted(di_edges)) + list(sorted(un_edges))
+        self.nodes = list(sorted({a for a, _ in edges} | {b for _, b in edges}))
+        node_ixs = {n: ix for ix, n in enumerate(self.nodes)}
+        n = len(self.nodes)
+        self.bound = ceil((1 + eps) * ceil(sum(node_weight(i) for i in self.nodes) / 2))
+
+        src = np.array([node_ixs[a] for a, _ in edges], dtype=np.intp)
+        tgt = np.array([node_ixs[b] for _, b in edges], dtype=np.intp)
+        weight = np.array([edge_weight(a, b) for a, b in edges], dtype=np.float64)
+        directed = np.arange(len(edges)) < len(di_edges)
+
+        # Contract the strongly connected components of the directed edges
+        _, self.comp_of = connected_components(
+            coo_matrix((np.ones(directed.sum()), (src[directed], tgt[directed])), shape=(n, n)),
+            directed=True,
+            connection="strong",
+        )
+        self.n_comps = int(self.comp_of.max()) + 1 if n > 0 else 0
+        self.comp_weights = np.bincount(
+            self.comp_of, weights=[node_weight(i) for i in self.nodes], minlength=self.n_comps
+        )
+
+        # Undirected adjacency (with parallel edges merged) used for the cut
+        c_src, c_tgt = self.comp_of[src], self.comp_of[tgt]
+        keep = c_src != c_tgt
+        rows = np.concatenate([c_src[keep], c_tgt[keep]])
+        cols = np.concatenate([c_tgt[keep], c_src[keep]])
+        adj = coo_matrix((np.tile(weight[keep], 2), (rows, cols)), shape=(self.n_comps, self.n_comps)).tocsr()
+        adj.sum_duplicates()
+        self.adj = adj
+        self.nbrs = [adj.indices[adj.indptr[c] : adj.indptr[c + 1]] for c in range(self.n_comps)]
+        self.nbr_weights = [adj.data[adj.indptr[c] : adj.indptr[c + 1]] for c in range(self.n_comps)]
+
+        # Directed adjacency (part A must come before part B)
+        d_keep = directed & keep
+        self.succs = [set() for _ in range(self.n_comps)]
+        self.preds = [set() for _ in range(self.n_comps)]
+        for a, b in zip(c_src[d_keep], c_tgt[d_keep]):
+            self.succs[a].add(b)
+            self.preds[b].add(a)
+
+    def cut_weight(self, comp_labels: np.ndarray) -> float:
+        coo = self.adj.tocoo()
+        # Every edge appears twice in the symmetric adjacency
+        return float(coo.data[comp_labels[coo.row] != comp_labels[coo.col]].sum() / 2)
+
+    def to_labels(self, comp_labels: np.ndarray) -> dict[int, int]:
+        return {node: int(comp_labels[self.comp_of[ix]]) for ix, node in enumerate(self.nodes)}
+
+    def from_labels(self, labels: dict[int, int]) -> np.ndarray | None:
+        "Converts a complete assignment of nodes to parts into labels (or None if it is not valid.)"
+        comp_labels = np.full(self.n_comps, -1, dtype=np.int8)
+        for ix, node in enumerate(self.nodes):
+            label = labels.get(node)
+            c = self.comp_of[ix]
+            if label not in (0, 1) or comp_labels[c] not in (-1, label):
+                return None
+            comp_labels[c] = label
+        if any(comp_labels[s] < comp_labels[c] for c in range(self.n_comps) for s in self.succs[c]):
+            return None
+        a_weight = self.comp_weights[comp_labels == 0].sum()
+        if a_weight > self.bound or self.comp_weights.sum() - a_weight > self.bound:
+            return None
+        return comp_labels
+
+    def topological_order(self, priority: Callable[[int, np.ndarray], float]) -> list[int]:
+        "Kahn's algorithm where the available component with the lowest priority is taken first."
+        in_degree = np.array([len(p) for p in self.preds], dtype=np.intp)
+        in_a = np.zeros(self.n_comps, dtype=bool)
+        heap = [(priority(c, in_a), c) for c in range(self.n_comps) if in_degree[c] == 0]
+        heapq.heapify(heap)
+        order = []
+        while len(heap) > 0:
+            _, c = heapq.heappop(heap)
+            if in_a[c]:
+                continue
+            in_a[c] = True
+            order.append(c)
+            for s in self.succs[c]:
+                in_degree[s] -= 1
+                if in_degree[s] == 0:
+                    heapq.heappush(heap, (priority(s, in_a), s))
+            # Priorities may depend on part A, so refresh the neighbours that are still waiting
+            for nbr in self.nbrs[c]:
+                if not in_a[nbr] and in_degree[nbr] == 0:
+                    heapq.heappush(heap, (priority(nbr, in_a), nbr))
+        return order
+
+    def best_prefix(self, order: list[int]) -> np.ndarray | None:
+        """Every prefix of a topological order is a valid part A. Returns the labels of the balanced prefix
+        with the lightest cut (or None if no prefix is balanced.)"""
+        total = self.comp_weights.sum()
+        comp_labels = np.ones(self.n_comps, dtype=np.int8)
+        best_cut, best_len = inf, None
+        a_weight, cut = 0.0, 0.0
+        for length in range(len(order) + 1):
+            if a_weight <= self.bound and total - a_weight <= self.bound and cut < best_cut:
+                best_cut, best_len = cut, length
+            if length == len(order):
+                break
+            c = order[length]
+            comp_labels[c] = 0
+            a_weight += self.comp_weights[c]
+            in_a = comp_labels[self.nbrs[c]] == 0
+            cut += self.nbr_weights[c][~in_a].sum() - self.nbr_weights[c][in_a].sum()
+        if best_len is None:
+            return None
+        comp_labels[:] = 1
+        comp_labels[order[:best_len]] = 0
+        return comp_labels
+
+    def refine(self, comp_labels: np.ndarray) -> np.ndarray:
+        "Fiduccia-Mattheyses refinement that only makes moves that keep the bisection balanced and acyclic."
+        comp_labels = comp_labels.copy()
+        for _ in range(FM_MAX_PASSES):
+            if self._fm_pass(comp_labels) <= 0:
+                break
+        return comp_labels
+
+    def _gain(self, c: int, comp_labels: np.ndarray) -> float:
+        differs = comp_labels[self.nbrs[c]] != comp_labels[c]
+        return self.nbr_weights[c][differs].sum() - self.nbr_weights[c][~differs].sum()
+
+    def _can_move(self, c: int, comp_labels: np.ndarray, part_weights: list[float]) -> bool:
+        if comp_labels[c] == 0:
+            # Moving to B requires every successor to be in B already
+            ok = all(comp_labels[s] == 1 for s in self.succs[c])
+        else:
+            # Moving to A requires every predecessor to be in A already
+            ok = all(comp_labels[p] == 0 for p in self.preds[c])
+        return ok and part_weights[1 - comp_labels[c]] + self.comp_weights[c] <= self.bound
+
+    def _fm_pass(self, comp_labels: np.ndarray) -> float:
+        gains = np.array([self._gain(c, comp_labels) for c in range(self.n_comps)])
+        part_weights = [
+            self.comp_weights[comp_labels == 0].sum(),
+            self.comp_weights[comp_labels == 1].sum(),
+        ]
+        heap = [(-gains[c], c) for c in range(self.n_comps)]
+        heapq.heapify(heap)
+        locked = np.zeros(self.n_comps, dtype=bool)
+        deferred = []
+        moves, total_gain, best_gain, best_len = [], 0.0, 0.0, 0
+        while len(heap) > 0 and len(moves) - best_len < FM_MAX_FRUITLESS_MOVES:
+            neg_gain, c = heapq.heappop(heap)
+            if locked[c] or -neg_gain != gains[c]:
+                continue
+            if not self._can_move(c, comp_labels, part_weights):
+                deferred.append(c)
+                continue
+
+            # Move c to the other part
+            part_weights[comp_labels[c]] -= self.comp_weights[c]
+            comp_labels[c] = 1 - comp_labels[c]
+            part_weights[comp_labels[c]] += self.comp_weights[c]
+            locked[c] = True
+            total_gain += gains[c]
+            moves.append(c)
+            if total_gain > best_gain:
+                best_gain, best_len = total_gain, len(moves)
+
+            # Update the gains of the neighbours and give the deferred moves another chance
+            for nbr, weight in zip(self.nbrs[c], self.nbr_weights[c]):
+                if not locked[nbr]:
+                    gains[nbr] += -2 * weight if comp_labels[nbr] == comp_labels[c] else 2 * weight
+                    heapq.heappush(heap, (-gains[nbr], nbr))
+            for d in deferred:
+                if not locked[d]:
+                    heapq.heappush(heap, (-gains[d], d))
+            deferred = []
+
+        # Undo every move after the best point
+        for c in moves[best_len:]:
+            comp_labels[c] = 1 - comp_labels[c]
+        return best_gain
+
+    def fiedler_vector(self) -> np.ndarray:
+        if self.n_comps < 2:
+            # There is no second eigenvector (and nothing to order)
+            return np.zeros(self.n_comps)
+        lap = laplacian(self.adj.astype(np.float64))
+        try:
+            if self.n_comps <= DENSE_EIGH_MAX_NODES:
+                _, vecs = np.linalg.eigh(lap.toarray())
+            else:
+                _, vecs = eigsh(lap, k=2, which="SA", tol=1e-4, maxiter=20 * self.n_comps)
+            return vecs[:, 1]
+        except (ArpackNoConvergence, np.linalg.LinAlgError):
+            return np.arange(self.n_comps, dtype=np.float64)
+
+
+def _bisect(
+    graph: _Graph, orders: list[list[int]], start: float, hint: dict[int, int] | None = None
+) -> tuple[float, dict[int, int] | None, ilp.SolveStats]:
+    starts = [graph.best_prefix(order) for order in orders]
+    if hint is not None:
+        starts.append(graph.from_labels(hint))
+    best_cut, best_labels = inf, None
+    for comp_labels in starts:
+        if comp_labels is None:
+            continue
+        comp_labels = graph.refine(comp_labels)
+        cut = graph.cut_weight(comp_labels)
+        if cut < best_cut:
+            best_cut, best_labels = cut, comp_labels
+    if best_labels is None:
+        return inf, None, ilp.SolveStats("unknown", inf, time.perf_counter() - start)
+    return best_cut, graph.to_labels(best_labels), ilp.SolveStats("heuristic", best_cut, time.perf_counter() - start)
+
+
+def _check_k(k: int):
+    if k != 2:
+        raise ValueError("the heuristic partitioners only support bisection (k=2)")
+
+
+def greedy_bisect(
+    di_edges: set[tuple[int, int]],
+    un_edges: set[tuple[int, int]],
+    node_weight: Callable[[int], int] | Mapping[int, int],
+    edge_weight: Callable[[int, int], int] | Mapping[tuple[int, int], int],
+    k: int,
+    eps: float,
+    max_time_in_seconds: float | None = None,
+    hint: dict[int, int] | None = None,
+    params: ilp.SolverParams | None = None,
+) -> tuple[float, dict[int, int] | None, ilp.SolveStats]:
+    """Grows part A in topological order (preferring nodes that are strongly connected to part A), takes the
+    best balanced prefix, and then refines it."""
+    start = time.perf_counter()
+    _check_k(k)
+    graph = _Graph(di_edges, un_edges, node_weight, edge_weight, eps)
+
+    def priority(c: int, in_a: np.ndarray) -> float:
+        return -graph.nbr_weights[c][in_a[graph.nbrs[c]]].sum()
+
+    return _bisect(graph, [graph.topological_order(priority)], start, hint)
+
+
+def spectral_bisect(
+    di_edges: set[tuple[int, int]],
+    un_edges: set[tuple[int, int]],
+    node_weight: Callable[[int], int] | Mapping[int, int],
+    edge_weight: Callable[[int, int], int] | Mapping[tuple[int, int], int],
+    k: int,
+    eps: float,
+    max_time_in_seconds: float | None = None,
+    hint: dict[int, int] | None = None,
+    params: ilp.SolverParams | None = None,
+) -> tuple[float, dict[int, int] | None, ilp.SolveStats]:
+    """Orders the nodes topologically (breaking ties with the Fiedler vector, from either end), takes the best
+    balanced prefix, and then refines it."""
+    start = time.perf_counter()
+    _check_k(k)
+    graph = _Graph(di_edges, un_edges, node_weight, edge_weight, eps)
+    fiedler = graph.fiedler_vector()
+    ascending = graph.topological_order(lambda c, _: fiedler[c])
+    descending = graph.topological_order(lambda c, _: -fiedler[c])
+    return _bisect(graph, [ascending, descending], start, hint)
+
+
+def hybrid_bisect(
+    di_edges: set[tuple[int, int]],
+    un_edges: set[tuple[int, int]],
+    node_weight: Callable[[int], int] | Mapping[int, int],
+    edge_weight: Callable[[int, int], int] | Mapping[tuple[int, int], int],
+    k: int,
+    eps: float,
+    max_time_in_seconds: float | None = None,
+    hint: dict[int, int] | None = None,
+    params: ilp.SolverParams | None = None,
+) -> tuple[float, dict[int, int] | None, ilp.SolveStats]:
+    """Runs the spectral heuristic and then the exact solver (starting from the heuristic solution), keeping
+    whichever cut is lighter."""
+    start = time.perf_counter()
+    args = (di_edges, un_edges, node_weight, edge_weight, k, eps, max_time_in_seconds)
+    heuristic = spectral_bisect(*args, hint=hint)
+    exact = ilp.bisect(*args, hint=heuristic[1] if heuristic[1] is not None else hint, params=params)
+    cut_weight, labels, stats = exact if exact[0] <= heuristic[0] else heuristic
+    stats.wall_time = time.perf_counter() - start
+    return cut_weight, labels, stats
+
+
+PARTITIONERS: dict[str, Partitioner] = {
+    "exact": ilp.bisect,
+    "greedy": greedy_bisect,
+    "spectral": spectral_bisect,
+    "hybrid": hybrid_bisect,
+}
+
+
+def choose_partitioner(di_edges: set[tuple[int, int]], un_edges: set[tuple[int, int]]) -> str:
+    "Picks a partitioner by the size and density of the problem."
+    edges = {(a, b) for a, b in di_edges | un_edges if a != b}
+    n_nodes = len({a for a, _ in edges} | {b for _, b in edges})
+    if n_nodes <= EXACT_MAX_NODES:
+        return "exact"
+    if n_nodes > HEURISTIC_MIN_NODES or len(edges) > HEURISTIC_MIN_EDGES:
+        return "spectral"
+    return "hybrid"
@@ -1,16 +1,96 @@
+import time
+from dataclasses import dataclass
 from math import ceil, inf
-from typing import Callable
+from typing import Callable, Mapping
 
 from ortools.sat.python import cp_model
 
 
+@dataclass
+class SolverParams:
+    "Settings for CP-SAT (None leaves the solver default)."
+    max_time_in_seconds: float | None = None
+    # 0 uses every core, so set this to the number of cores given to each job
+    num_workers: int = 0
+    random_seed: int | None = None
+    max_deterministic_time: float | None = None
+    log_search_progress: bool = False
+
+    def apply(self, solver: cp_model.CpSolver, max_time_in_seconds: float | None = None):
+        max_time_in_seconds = max_time_in_seconds or self.max_time_in_seconds
+        if max_time_in_seconds:
+            solver.parameters.max_time_in_seconds = max_time_in_seconds
+        solver.parameters.num_workers = self.num_workers
+        if self.random_seed is not None:
+            solver.parameters.random_seed = self.random_seed
+        if self.max_deterministic_time is not None:
+            solver.parameters.max_deterministic_time = self.max_deterministic_time
+        solver.parameters.log_search_progress = self.log_search_progress
+
+
+@dataclass
+class SolveStats:
+    # One of "optimal", "feasible", "infeasible" or "unknown" (or "heuristic" for a heuristic partitioner)
+    status: str
+    objective: float
+    wall_time: float
+    # How long it took to build the model (included in `wall_time`)
+    build_time: float = 0.0
+    # The size of the graph that was partitioned (see `clustering.bisect`)
+    model_nodes: int = 0
+    model_edges: int = 0
+    # The size of the CP-SAT model
+    n_variables: int = 0
+    n_constraints: int = 0
+    # The best proven lower bound on the objective and the relative gap to it
+    best_bound: float = inf
+    gap: float = inf
+    branches: int = 0
+    conflicts: int = 0
+    # The deterministic time (in work units) spent in the solver
+    deterministic_time: float = 0.0
+
+
+_STATUS_NAMES = {
+    cp_model.OPTIMAL: "optimal",
+    cp_model.FEASIBLE: "feasible",
+    cp_model.INFEASIBLE: "infeasible",
+}
+
+
+def _to_stats(
+    model: cp_model.CpModel, solver: cp_model.CpSolver, status: int, start: float, built: float
+) -> SolveStats:
+    name = _STATUS_NAMES.get(status, "unknown")
+    solved = name in ("optimal", "feasible")
+    objective = solver.ObjectiveValue() if solved else inf
+    best_bound = solver.BestObjectiveBound() if solved else inf
+    proto = model.Proto()
+    return SolveStats(
+        name,
+        objective,
+        time.perf_counter() - start,
+        built - start,
+        n_variables=len(proto.variables),
+        n_constraints=len(proto.constraints),
+        best_bound=best_bound,
+        gap=abs(objective - best_bound) / max(1.0, abs(objective)) if solved else inf,
+        branches=solver.NumBranches(),
+        conflicts=solver.NumConflicts(),
+        deterministic_time=solver.ResponseProto().deterministic_time,
+    )
+
+
 def partition(
     edges: list[tuple[int, int]],
     w: Callable[[int], int],
     c: Callable[[int, int], int],
     k: int,
     eps: float,
-) -> tuple[float, dict[int, int] | None]:
+    params: SolverParams | None = None,
+) -> tuple[float, dict[int, int] | None, SolveStats]:
+    start = time.perf_counter()
+
     # Remove any self-edges or duplicates
     edges = list(sorted({(a, b) for a, b in edges if a != b}))
 
@@ -73,13 +153,16 @@ def partition(
             model.Add(y[s, t] == 0)
 
     # Solve
+    built = time.perf_counter()
     solver = cp_model.CpSolver()
-    solver.parameters.max_time_in_seconds = 30.0
+    params = params or SolverParams()
+    params.apply(solver, params.max_time_in_seconds or 30.0)
     status = solver.Solve(model)
+    stats = _to_stats(model, solver, status, start, built)
 
     # Check if successful
     if status != cp_model.OPTIMAL and status != cp_model.FEASIBLE:
-        return 0.0, None
+        return 0.0, None, stats
 
     # Extract labels into dictionary
     labels = {}
@@ -87,18 +170,38 @@ def partition(
         for s in parts:
             if solver.BooleanValue(x[i, s]):
                 labels[i] = s
-    return solver.ObjectiveValue(), labels
+    return solver.ObjectiveValue(), labels, stats
+
+
+def as_weight_fns(
+    node_weight: Callable[[int], int] | Mapping[int, int],
+    edge_weight: Callable[[int, int], int] | Mapping[tuple[int, int], int],
+) -> tuple[Callable[[int], int], Callable[[int, int], int]]:
+    "Turns precomputed weight tables into functions (so that weights may be given either way)."
+    if isinstance(node_weight, Mapping):
+        node_weight = node_weight.__getitem__
+    if isinstance(edge_weight, Mapping):
+        edge_weights = edge_weight
+        edge_weight = lambda i, j: edge_weights[i, j]
+    return node_weight, edge_weight
 
 
 def partition2(
     di_edges: set[tuple[int, int]],
     un_edges: set[tuple[int, int]],
-    node_weight: Callable[[int], int],
-    edge_weight: Callable[[int, int], int],
+    node_weight: Callable[[int], int] | Mapping[int, int],
+    edge_weight: Callable[[int, int], int] | Mapping[tuple[int, int], int],
     k: int,
     eps: float,
     max_time_in_seconds: float | None = None,
-) -> tuple[float, dict[int, int] | None]:
+    hint: dict[int, int] | None = None,
+    callback: cp_model.CpSolverSolutionCallback | None = None,
+    params: SolverParams | None = None,
+) -> tuple[float, dict[int, int] | None, SolveStats]:
+    start = time.perf_counter()
+
+    node_weight, edge_weight = as_weight_fns(node_weight, edge_weight)
+
     # Remove any self-edges
     di_edges = {(a, b) for a, b in di_edges if a != b}
     un_edges = {(a, b) for a, b in un_edges if a != b}
@@ -169,15 +272,26 @@ def partition2(
         for t in parts[:s]:
             model.Add(y[s, t] == 0)
 
+    # Hint: Start the search from a known assignment of nodes to parts (e.g. from a heuristic)
+    if hint is not None:
+        for i in nodes:
+            if i in hint:
+                for s in parts:
+                    model.AddHint(x[i, s], hint[i] == s)
+        for i, j in edges:
+            if i in hint and j in hint:
+                model.AddHint(z[i, j], hint[i] != hint[j])
+
     # Solve
+    built = time.perf_counter()
     solver = cp_model.CpSolver()
-    if max_time_in_seconds:
-        solver.parameters.max_time_in_seconds = max_time_in_seconds
-    status = solver.Solve(model)
+    (params or SolverParams()).apply(solver, max_time_in_seconds)
+    status = solver.Solve(model, callback)
+    stats = _to_stats(model, solver, status, start, built)
 
     # Check if successful
     if status != cp_model.OPTIMAL and status != cp_model.FEASIBLE:
-        return inf, None
+        return inf, None, stats
 
     # Extract labels into dictionary
     labels = {}
@@ -185,4 +299,94 @@ def partition2(
         for s in parts:
             if solver.BooleanValue(x[i, s]):
                 labels[i] = s
-    return solver.ObjectiveValue(), labels
+    return solver.ObjectiveValue(), labels, stats
+
+
+def bisect(
+    di_edges: set[tuple[int, int]],
+    un_edges: set[tuple[int, int]],
+    node_weight: Callable[[int], int] | Mapping[int, int],
+    edge_weight: Callable[[int, int], int] | Mapping[tuple[int, int], int],
+    k: int,
+    eps: float,
+    max_time_in_seconds: float | None = None,
+    hint: dict[int, int] | None = None,
+    callback: cp_model.CpSolverSolutionCallback | None = None,
+    params: SolverParams | None = None,
+) -> tuple[float, dict[int, int] | None, SolveStats]:
+    """The same problem as `partition2` for k=2, but with a smaller model: one literal per node (which is true
+    for part 1), an implication per directed edge, and a cut literal per undirected edge only."""
+    start = time.perf_counter()
+    if k != 2:
+        raise ValueError("bisect only supports k=2 (use partition2 instead)")
+
+    node_weight, edge_weight = as_weight_fns(node_weight, edge_weight)
+
+    # Same preprocessing as `partition2`
+    di_edges = sorted({(a, b) for a, b in di_edges if a != b})
+    un_edges = sorted({(a, b) for a, b in un_edges if a != b} - set(di_edges))
+    nodes = list(sorted({a for a, _ in di_edges + un_edges} | {b for _, b in di_edges + un_edges}))
+
+    # Part 0 may hold at most `bound`, so part 1 must hold at least `total - bound`
+    weights = [node_weight(i) for i in nodes]
+    total = sum(weights)
+    bound = ceil((1 + eps) * ceil(total / k))
+
+    model = cp_model.CpModel()
+
+    # Variable: x_i indicates that node i is assigned to part 1
+    x = {i: model.NewBoolVar(f"x[{i}]") for i in nodes}
+
+    # Variable: z_ij indicates that undirected edge (i,j) is a cut edge
+    z = [model.NewBoolVar(f"z[{i},{j}]") for i, j in un_edges]
+
+    # Constraint: No edges from part 1 back to part 0 (so a directed edge is cut exactly when x_j - x_i = 1)
+    for i, j in di_edges:
+        model.AddImplication(x[i], x[j])
+
+    # Constraint: Mark the undirected cut edges as one if they are in different parts.
+    for (i, j), z_ij in zip(un_edges, z):
+        model.Add(x[i] - x[j] <= z_ij)
+        model.Add(x[j] - x[i] <= z_ij)
+
+    # Constraint: No part must be larger than a certain bound.
+    model.AddLinearConstraint(cp_model.LinearExpr.WeightedSum([x[i] for i in nodes], weights), total - bound, bound)
+
+    # Objective: Minimize the edge cut (the directed part is folded into one coefficient per node).
+    coeffs = dict.fromkeys(nodes, 0)
+    for i, j in di_edges:
+        c = edge_weight(i, j)
+        coeffs[j] += c
+        coeffs[i] -= c
+    model.Minimize(
+        cp_model.LinearExpr.WeightedSum(
+            [x[i] for i in nodes] + z, [coeffs[i] for i in nodes] + [edge_weight(i, j) for i, j in un_edges]
+        )
+    )
+
+    # Symmetry: Without directed edges, swapping the parts gives an equivalent solution
+    flip = False
+    if len(di_edges) == 0 and len(nodes) > 0:
+        model.Add(x[nodes[0]] == 0)
+        flip = hint is not None and hint.get(nodes[0]) == 1
+
+    # Hint: Start the search from a known assignment of nodes to parts (e.g. from a heuristic)
+    if hint is not None:
+        for i in nodes:
+            if i in hint:
+                model.AddHint(x[i], (hint[i] == 1) != flip)
+        for (i, j), z_ij in zip(un_edges, z):
+            if i in hint and j in hint:
+                model.AddHint(z_ij, hint[i] != hint[j])
+
+    # Solve
+    built = time.perf_counter()
+    solver = cp_model.CpSolver()
+    (params or SolverParams()).apply(solver, max_time_in_seconds)
+    status = solver.Solve(model, callback)
+    stats = _to_stats(model, solver, status, start, built)
+
+    # Check if successful
+    if status != cp_model.OPTIMAL and status != cp_model.FEASIBLE:
+        return inf, None, stats
+    return solver.ObjectiveValue(), {i: int(solver.BooleanValue(x[i])) for i in nodes}, stats
@@ -0,0 +1,153 @@
+import inspect
+import sqlite3
+import time
+from dataclasses import replace
+from typing import Callable
+
+import pandas as pd
+
+from filesplitter import db
+
+# The indexes that the queries would use, as (table, columns). Each one covers the columns read through it.
+RECOMMENDED_INDEXES = [
+    ("entities", ["parent_id", "id"]),
+    ("entities", ["name"]),
+    ("presence", ["entity_id", "commit_id", "start_row", "end_row"]),
+    ("deps", ["src_id", "tgt_id", "kind", "commit_id"]),
+    ("deps", ["tgt_id", "src_id", "kind", "commit_id"]),
+    ("changes", ["entity_id", "commit_id", "adds", "dels"]),
+    ("refs", ["name", "commit_id"]),
+    ("refs", ["commit_id", "name"]),
+]
+
+# The schema that `prepare_fetches` keeps the churn tables in (so that the database itself is left alone)
+CHURN_SCHEMA = "advisor"
+
+
+def _fetch_call(fetch: Callable[..., object]) -> Callable[[sqlite3.Connection, dict], object]:
+    "Calls the fetch function with the parameters named after its arguments."
+    arg_names = list(inspect.signature(fetch).parameters)[1:]
+    return lambda con, p: fetch(con, *(p[a] for a in arg_names))
+
+
+# How to call the fetch function of each query (see `db.FETCH_FUNCTIONS`) with the parameters from `sample_params`
+FETCHES: dict[str, Callable[[sqlite3.Connection, dict], object]] = {
+    name: _fetch_call(fetch) for name, fetch in db.FETCH_FUNCTIONS.items()
+}
+
+
+def sample_params(con: sqlite3.Connection) -> dict:
+    "Picks the parameters of a realistic subject: the lead ref and the file with the largest top level item."
+    target_file, target_id = con.execute(
+        """
+        SELECT F.name, C.id
+        FROM entities F
+        JOIN entities C ON C.parent_id = F.id
+        JOIN entities M ON M.parent_id = C.id
+        WHERE F.parent_id IS NULL AND F.kind = 'file'
+        GROUP BY C.id
+        ORDER BY COUNT(*) DESC
+        LIMIT 1
+        """
+    ).fetchone()
+    return {
+        "ref_name": db.fetch_lead_ref_name(con),
+        "min_locs": 800,
+        "min_authors": 0,
+        "target_id": str(target_id),
+        "target_file": target_file,
+        "name": target_file,
+    }
+
+
+def prepare_fetches(con: sqlite3.Connection, params: dict):
+    """Creates what some of the queries rely on besides the temp tables: the targets of the fetch_batch_*
+    queries and the churn tables of `fetch_ref_candidate_files` (in an in-memory schema)."""
+    db.set_batch_targets(con, [(params["target_file"], int(params["target_id"]))])
+    if CHURN_SCHEMA not in {row[1] for row in con.execute("PRAGMA database_list")}:
+        con.execute(f"ATTACH DATABASE ':memory:' AS {CHURN_SCHEMA}")
+    db.update_churn(con, CHURN_SCHEMA)
+
+
+def explain(con: sqlite3.Connection, query_name: str, params: dict) -> list[str]:
+    sql = db.queries()[query_name]
+    return [row[3] for row in con.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def is_scan(detail: str) -> bool:
+    "Whether a step of a query plan reads a whole table (or has to build a temporary index to avoid that)."
+    return (detail.startswith("SCAN ") and detail != "SCAN CONSTANT ROW") or "AUTOMATIC" in detail
+
+
+def find_scans(con: sqlite3.Connection, params: dict) -> pd.DataFrame:
+    "Lists the steps of the query plans (of every fetch function) that scan tables."
+    rows = []
+    for query_name in FETCHES:
+        for detail in explain(con, query_name, params):
+            if is_scan(detail):
+                rows.append((query_name, detail))
+    return pd.DataFrame(rows, columns=["query", "detail"])
+
+
+def index_name(table: str, columns: list[str]) -> str:
+    return f"fs_{table}_{'_'.join(columns)}"
+
+
+def missing_indexes(con: sqlite3.Connection) -> list[tuple[str, list[str]]]:
+    "Returns the recommended indexes that aren't covered by an existing index (with the same leading columns)."
+    missing = []
+    for table, columns in RECOMMENDED_INDEXES:
+        existing = []
+        for _, name, *_ in con.execute(f"PRAGMA main.index_list({table})").fetchall():
+            existing.append([row[2] for row in con.execute(f"PRAGMA main.index_info({name})")])
+        if not any(cols[: len(columns)] == columns for cols in existing):
+            missing.append((table, columns))
+    return missing
+
+
+def create_indexes(con: sqlite3.Connection, indexes: list[tuple[str, list[str]]]):
+    for table, columns in indexes:
+        con.execute(f"CREATE INDEX IF NOT EXISTS main.{index_name(table, columns)} ON {table} ({', '.join(columns)})")
+    con.execute("ANALYZE main")
+    con.commit()
+
+
+def copy_database(src_path: str, dst_path: str):
+    with db.connect(src_path) as src, sqlite3.connect(dst_path) as dst:
+        src.backup(dst)
+
+
+def time_fetches(con: sqlite3.Connection, params: dict) -> dict[str, float]:
+    elapsed = {}
+    for query_name, fetch in FETCHES.items():
+        start = time.perf_counter()
+        fetch(con, params)
+        elapsed[query_name] = time.perf_counter() - start
+    return elapsed
+
+
+def advise(db_path: str, copy_path: str | None = None) -> pd.DataFrame:
+    """Times every fetch function on the database and counts the scans in its query plan. If `copy_path` is
+    given, the missing indexes are created on a copy of the database (SQLite keeps indexes in the same file as
+    their tables) and everything is measured again there."""
+    with db.connect(db_path) as con:
+        db.create_temp_tables(con)
+        params = sample_params(con)
+        prepare_fetches(con, params)
+        report = find_scans(con, params).groupby("query").size().rename("scans").to_frame()
+        report = report.reindex(list(FETCHES), fill_value=0)
+        report["seconds"] = pd.Series(time_fetches(con, params))
+        missing = missing_indexes(con)
+    print(f"Missing indexes: {', '.join(index_name(t, c) for t, c in missing) or 'none'}")
+    if copy_path is None:
+        return report
+    copy_database(db_path, copy_path)
+    with db.connect(copy_path, replace(db.CONNECTION_PROFILE, read_only=False, immutable=False)) as con:
+        create_indexes(con, missing)
+        db.create_temp_tables(con)
+        prepare_fetches(con, params)
+        after = find_scans(con, params).groupby("query").size()
+        report["indexed_scans"] = after.reindex(report.index, fill_value=0)
+        report["indexed_seconds"] = pd.Series(time_fetches(con, params))
+    return report
+
@@ -1,11 +1,38 @@
 import sqlite3
 import os
-from dataclasses import dataclass
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, replace
+from typing import Iterable, Iterator
 
 import pandas as pd
 
 
 from filesplitter import db
+from filesplitter.dataset_cache import DatasetCache, dataset_key
+from filesplitter.graph import Edges
+
+# Tables prepared by `prepare_database` are kept in a sidecar file named after the database (unless in place)
+PREPARED_SUFFIX = ".prepared"
+
+# The columns of the candidate files of a database (see `fetch_candidate_files` and `fetch_ref_candidate_files`)
+CANDIDATE_COLUMNS = [
+    "ref_name",
+    "ref_date",
+    "filename",
+    "kind",
+    "loc",
+    "member_count",
+    "fan_in",
+    "author_count",
+    "committer_count",
+    "adds",
+    "dels",
+    "churn",
+]
+
+# Set with `use_dataset_cache` to keep loaded datasets on disk
+_dataset_cache: DatasetCache | None = None
 
 
 @dataclass
@@ -23,10 +50,64 @@ class Dataset:
     def deps_df(self) -> pd.DataFrame:
         return pd.concat([self.target_deps_df, self.client_deps_df])
 
+    def dep_edges(self) -> Edges:
+        deps_df = self.deps_df()
+        return Edges(deps_df["src_id"].to_numpy(), deps_df["tgt_id"].to_numpy(), deps_df["kind"].to_numpy())
+
+
+def prepare_database(db_path: str, in_place: bool = False):
+    """Materializes the tables of the prelude once so that loading with `prepared=True` can skip it. They are
+    rebuilt automatically by later loads if the database changes."""
+    profile = replace(db.CONNECTION_PROFILE, read_only=False, immutable=False)
+    with db.connect(db_path, profile) as con:
+        if in_place:
+            db.prepare_tables(con, "main")
+        else:
+            db.prepare_tables(con, _attach_sidecar(con, db_path))
+
+
+def _attach_sidecar(con: sqlite3.Connection, db_path: str) -> str:
+    if "prepared" not in {row[1] for row in con.execute("PRAGMA database_list")}:
+        con.execute("ATTACH DATABASE ? AS prepared", (db_path + PREPARED_SUFFIX,))
+    return "prepared"
+
 
-def load_dataset(db_path: str, filename: str) -> Dataset:
-    with sqlite3.connect(db_path) as con:
+def _create_temp_tables(con: sqlite3.Connection, db_path: str, prepared: bool):
+    if not prepared:
         db.create_temp_tables(con)
+    elif db.prepared_fingerprint(con, "main") == db.fingerprint(con):
+        db.create_temp_tables(con, "main")
+    else:
+        db.create_temp_tables(con, _attach_sidecar(con, db_path))
+
+
+def use_dataset_cache(dataset_cache: DatasetCache | None) -> DatasetCache | None:
+    global _dataset_cache
+    previous = _dataset_cache
+    _dataset_cache = dataset_cache
+    return previous
+
+
+def load_dataset(db_path: str, filename: str, prepared: bool = False, scoped: bool = False) -> Dataset:
+    """Loads the members of a file and its clients. If `scoped`, the temp tables only cover the file and its
+    clients rather than the whole history (which makes no difference if the database is `prepared`)."""
+    if _dataset_cache is None:
+        return _load_dataset(db_path, filename, prepared, scoped)
+    with db.connect(db_path) as con:
+        key = dataset_key(db_path, filename, db.fetch_lead_ref_name(con))
+    fields = _dataset_cache.get(key)
+    if fields is not None:
+        return Dataset(**fields)
+    ds = _load_dataset(db_path, filename, prepared, scoped)
+    _dataset_cache.put(key, asdict(ds), db_path)
+    return ds
+
+
+def _load_dataset(db_path: str, filename: str, prepared: bool, scoped: bool) -> Dataset:
+    scoped = scoped and not prepared
+    with db.connect(db_path) as con:
+        if not scoped:
+            _create_temp_tables(con, db_path, prepared)
         lead_ref_name = db.fetch_lead_ref_name(con)
         files_df = db.fetch_entities_by_name(con, filename)
         files_df = files_df[files_df["kind"] == "file"]
@@ -35,6 +116,8 @@ def load_dataset(db_path: str, filename: str) -> Dataset:
         if len(files_df) > 1:
             raise RuntimeError(f"Too many files named '{filename}' found")
         top_id = int(files_df.iloc[0]["id"])
+        if scoped:
+            db.create_scoped_temp_tables(con, top_id)
         targets_df = db.fetch_children(con, lead_ref_name, top_id)
         # If there is only one top level item (e.g. a Java class), skip to its children
         if len(targets_df) == 1:
@@ -55,20 +138,152 @@ def load_dataset(db_path: str, filename: str) -> Dataset:
         )
 
 
-def load_subjects_df(data_dir: str, max_subjects_per_db: int) -> pd.DataFrame:
-    subjects_dfs = []
-    for db_name in list(sorted(os.listdir(data_dir))):
-        print(f"Finding subjects in {db_name}...")
-        with sqlite3.connect(os.path.join(data_dir, db_name)) as con:
-            db.create_temp_tables(con)
+def _split_by_target(df: pd.DataFrame, top_ids: Iterable[int], index_col: str | None = None) -> dict[int, pd.DataFrame]:
+    "Splits the result of a fetch_batch_* query into one data frame per target (like the fetch_* query would give)."
+    groups = dict(list(df.groupby("target_id", sort=False)))
+    parts = {}
+    for top_id in top_ids:
+        part = groups.get(top_id, df.iloc[:0]).drop(columns="target_id").reset_index(drop=True)
+        parts[top_id] = part if index_col is None else part.set_index(index_col)
+    return parts
+
+
+def _load_db_datasets(con: sqlite3.Connection, lead_ref_name: str, filenames: list[str]) -> dict[str, Dataset]:
+    "Loads the datasets of many files in the same database with one round of set-based queries."
+    db.set_batch_targets(con, [(filename, None) for filename in filenames])
+    files_df = db.fetch_batch_files(con)
+    counts = files_df["filename"].value_counts()
+    for filename in filenames:
+        if counts.get(filename, 0) < 1:
+            raise RuntimeError(f"No files named '{filename}' found")
+        if counts.get(filename, 0) > 1:
+            raise RuntimeError(f"Too many files named '{filename}' found")
+    top_ids = {fn: int(id) for fn, id in zip(files_df["filename"], files_df["id"])}
+
+    db.set_batch_targets(con, list(top_ids.items()))
+    children = _split_by_target(db.fetch_batch_children(con, lead_ref_name), top_ids.values(), "id")
+    # If there is only one top level item (e.g. a Java class), skip to its children
+    skipped = {fn: int(children[id].index[0]) for fn, id in top_ids.items() if len(children[id]) == 1}
+    if len(skipped) > 0:
+        db.set_batch_targets(con, list(skipped.items()))
+        children |= _split_by_target(db.fetch_batch_children(con, lead_ref_name), skipped.values(), "id")
+        top_ids |= skipped
+
+    db.set_batch_targets(con, list(top_ids.items()))
+    ids = top_ids.values()
+    target_deps = _split_by_target(db.fetch_batch_internal_deps(con), ids)
+    clients = _split_by_target(db.fetch_batch_clients(con), ids, "id")
+    client_deps = _split_by_target(db.fetch_batch_client_deps(con), ids)
+    outgoing_type_names = _split_by_target(db.fetch_batch_outgoing_type_names(con), ids)
+    touches = _split_by_target(db.fetch_batch_touches(con, lead_ref_name), ids)
+    return {
+        fn: Dataset(
+            children[id],
+            target_deps[id],
+            clients[id],
+            client_deps[id],
+            list(outgoing_type_names[id]["name"]),
+            touches[id],
+        )
+        for fn, id in top_ids.items()
+    }
+
+
+def load_datasets(pairs: list[tuple[str, str]], prepared: bool = False) -> Iterator[tuple[int, Dataset]]:
+    """Loads the dataset of each (db_path, filename) pair, opening each database once and loading all of its
+    files together. Yields the position of each pair with its dataset, one database at a time (in the order
+    the databases first appear)."""
+    positions_by_db: dict[str, list[int]] = {}
+    for i, (db_path, _) in enumerate(pairs):
+        positions_by_db.setdefault(db_path, []).append(i)
+    for db_path, positions in positions_by_db.items():
+        with db.connect(db_path) as con:
+            lead_ref_name = db.fetch_lead_ref_name(con)
+            keys, cached = {}, {}
+            if _dataset_cache is not None:
+                for i in positions:
+                    keys[i] = dataset_key(db_path, pairs[i][1], lead_ref_name)
+                    fields = _dataset_cache.get(keys[i])
+                    if fields is not None:
+                        cached[i] = Dataset(**fields)
+            filenames = list(dict.fromkeys(pairs[i][1] for i in positions if i not in cached))
+            datasets = {}
+            if len(filenames) > 0:
+                _create_temp_tables(con, db_path, prepared)
+                datasets = _load_db_datasets(con, lead_ref_name, filenames)
+        for i in positions:
+            if i in cached:
+                yield i, cached[i]
+                continue
+            ds = datasets[pairs[i][1]]
+            if _dataset_cache is not None:
+                _dataset_cache.put(keys[i], asdict(ds), db_path)
+            yield i, ds
+        # Let go of this database's datasets before loading the next one
+        del datasets, cached
+
+
+def _find_subjects(
+    db_path: str, prepared: bool, incremental: bool
+) -> tuple[pd.DataFrame | None, float, str | None]:
+    "Returns the candidate files of a database, how long finding them took and what went wrong (if anything)."
+    start = time.perf_counter()
+    try:
+        con = db.connect(db_path)
+        try:
+            _create_temp_tables(con, db_path, prepared)
             ref_name = db.fetch_lead_ref_name(con)
-            subjects = db.fetch_candidate_files(con, ref_name, 800, 0)
+            if incremental:
+                db.update_churn(con, _attach_sidecar(con, db_path))
+                subjects = db.fetch_ref_candidate_files(con, ref_name, 800, 0)
+            else:
+                subjects = db.fetch_candidate_files(con, ref_name, 800, 0)
+        finally:
+            con.close()
+    except Exception as e:
+        return None, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+    return subjects, time.perf_counter() - start, None
+
+
+def load_subjects_df(
+    data_dir: str, max_subjects_per_db: int, prepared: bool = False, n_jobs: int = 1, incremental: bool = False
+) -> pd.DataFrame:
+    """Finds the candidate files of every database in `data_dir` (with a pool of `n_jobs` processes if more than
+    one). A database that can't be scanned is reported and skipped. How long each one took (and what went
+    wrong) ends up in `attrs["scan_stats"]`. If `incremental`, only the commits of the lead ref are scanned and
+    the churn of each file is kept up to date in the sidecar (see `prepare_database`) rather than recomputed."""
+    db_names = [n for n in sorted(os.listdir(data_dir)) if not n.endswith(PREPARED_SUFFIX)]
+    db_paths = [os.path.join(data_dir, db_name) for db_name in db_names]
+    if n_jobs > 1:
+        pool = ProcessPoolExecutor(n_jobs)
+        results = pool.map(_find_subjects, db_paths, [prepared] * len(db_paths), [incremental] * len(db_paths))
+    else:
+        pool = None
+        results = (_find_subjects(db_path, prepared, incremental) for db_path in db_paths)
+    subjects_dfs = []
+    scan_stats = []
+    try:
+        # Results come back in the order of the databases (even if they finish out of order)
+        for db_name, (subjects, seconds, error) in zip(db_names, results):
+            scan_stats.append((db_name, seconds, 0 if subjects is None else len(subjects), error))
+            if error is not None:
+                print(f"Failed to find subjects in {db_name} ({seconds:.1f} secs): {error}")
+                continue
+            print(f"Found {len(subjects)} subjects in {db_name} ({seconds:.1f} secs)")
             subjects.insert(0, "project", db_name.split(".")[0])
             subjects_dfs.append(subjects[0:max_subjects_per_db])
-    subjects = pd.concat(subjects_dfs, ignore_index=True)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    if len(subjects_dfs) == 0:
+        # Every database failed (or there were none)
+        subjects = pd.DataFrame(columns=["project"] + CANDIDATE_COLUMNS)
+    else:
+        subjects = pd.concat(subjects_dfs, ignore_index=True)
     subject_names = [
         "{}__{}".format(p, "_".join(fn.split("/")[-2:]))
         for p, fn in zip(subjects["project"], subjects["filename"])
     ]
     subjects.insert(0, "subject_name", subject_names)
+    subjects.attrs["scan_stats"] = pd.DataFrame(scan_stats, columns=["db_name", "seconds", "candidates", "error"])
     return subjects
@@ -1,17 +1,24 @@
-import math
 from itertools import chain, pairwise
-from functools import cache
-from typing import Callable
+from functools import lru_cache
+from typing import Iterable
 from collections import Counter
 
 from ordered_set import OrderedSet as oset
 import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix, issparse, vstack
 from sklearn.decomposition import PCA
-import nltk
+
+from filesplitter.stemming import StemCache
 
 # STOP_WORDS = {"m", "get", "set", "on", "by", "for", "as", "is", "and", "in", "has"}
 STOP_WORDS = {}
 
+# The number of identifiers whose terms (and normalized names) are remembered
+NAME_CACHE_SIZE = 2**16
+
+# Shared by every call to `termize` (see `use_stem_cache`)
+_stem_cache = StemCache()
+
 def join_singles(terms: list[str]) -> list[str]:
     ret = []
     joined_term = []
@@ -42,10 +49,9 @@ def split_identifier(name: str) -> list[str]:
     return list(chain(*(split_camal(z) for z in by_underscores)))
 
 
-@cache
+@lru_cache(maxsize=NAME_CACHE_SIZE)
 def termize(name: str) -> list[str]:
-    stemmer = nltk.stem.PorterStemmer()
-    terms = (stemmer.stem(z) for z in split_identifier(name))
+    terms = (_stem_cache.stem(z) for z in split_identifier(name))
     return [t for t in terms if t not in STOP_WORDS]
 
 
@@ -65,11 +71,48 @@ def skip_bigramize(terms: list[str], lookback: int) -> list[str]:
     return bigrams
 
 
-@cache
+@lru_cache(maxsize=NAME_CACHE_SIZE)
 def normalize_name(doc: str) -> str:
     return "_".join(termize(doc))
 
 
+def use_stem_cache(stem_cache: StemCache) -> StemCache:
+    """Replaces the stem cache used by `termize` (e.g. with one backed by a file shared between processes.)
+    Returns the previous one, which is left open so that it can be restored."""
+    global _stem_cache
+    previous = _stem_cache
+    previous.flush()
+    _stem_cache = stem_cache
+    termize.cache_clear()
+    normalize_name.cache_clear()
+    return previous
+
+
+def flush_stem_cache():
+    _stem_cache.flush()
+
+
+def cache_info() -> dict:
+    return {
+        "termize": termize.cache_info(),
+        "normalize_name": normalize_name.cache_info(),
+        "stem": _stem_cache.cache_info(),
+    }
+
+
+def format_cache_info() -> str:
+    info = cache_info()
+    parts = []
+    for name in ["termize", "normalize_name"]:
+        hits, misses = info[name].hits, info[name].misses
+        rate = hits / (hits + misses) if hits + misses > 0 else 0.0
+        parts.append(f"{name}: {rate:0.2%} of {hits + misses}")
+    stem = info["stem"]
+    lookups = stem.hits + stem.disk_hits + stem.misses
+    parts.append(f"stem: {stem.hit_rate:0.2%} of {lookups} ({stem.disk_hits} from disk)")
+    return "Cache hit rates - " + ", ".join(parts)
+
+
 def to_occurrences(doc: str, lookback: int) -> list[tuple[str, str]]:
     normalized = normalize_name(doc)
     terms = termize(doc)
@@ -77,110 +120,213 @@ def to_occurrences(doc: str, lookback: int) -> list[tuple[str, str]]:
     return [(t, normalized) for t in terms + bigrams]
 
 
-class NameSimilarity:
-    def __init__(self, names: list[str], allow_dup_names: bool = True, lookback: int = 1):
-        # Populate a counter for term-document pairs (aka occurrances)
-        collect = list if allow_dup_names else set
-        pair_counts = Counter(collect(chain(*(to_occurrences(n, lookback) for n in names))))
+def to_count_arrays(
+    pair_counts: Counter, terms: oset, docs: oset
+) -> tuple[coo_matrix, np.ndarray, np.ndarray]:
+    "Converts term-document pair counts into a sparse terms x docs matrix along with the marginal counts."
+    rows = np.fromiter((terms.index(t) for t, _ in pair_counts), dtype=np.intp, count=len(pair_counts))
+    cols = np.fromiter((docs.index(d) for _, d in pair_counts), dtype=np.intp, count=len(pair_counts))
+    data = np.fromiter(pair_counts.values(), dtype=np.float64, count=len(pair_counts))
+    pair_mat = coo_matrix((data, (rows, cols)), shape=(len(terms), len(docs)))
+    term_counts = np.bincount(rows, weights=data, minlength=len(terms))
+    doc_counts = np.bincount(cols, weights=data, minlength=len(docs))
+    return pair_mat, term_counts, doc_counts
+
+
+def _plogq(p: np.ndarray, q: np.ndarray) -> np.ndarray:
+    "Evaluates p * log(p / q) elementwise where 0 * log(0) is taken to be 0."
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(p > 0.0, p * np.log(p / q), 0.0)
+
+
+def mi_matrix(pair_mat: coo_matrix, term_counts: np.ndarray, doc_counts: np.ndarray) -> np.ndarray:
+    "Evaluates mutual information I(X_i; Y_j) for every term i and document j (see NAMING.md)."
+    total = term_counts.sum()
+    c_ij = pair_mat.toarray()
+    c_i = term_counts[:, np.newaxis]
+    c_j = doc_counts[np.newaxis, :]
+
+    # Marginals
+    p_i_1 = c_i / total
+    p_i_0 = (total - c_i) / total
+    p_j_1 = c_j / total
+    p_j_0 = (total - c_j) / total
+
+    # Joint distributions
+    p_ij_11 = c_ij / total
+    p_ij_10 = (c_i - c_ij) / total
+    p_ij_01 = (c_j - c_ij) / total
+    p_ij_00 = (total + c_ij - c_i - c_j) / total
+
+    a = _plogq(p_ij_11, p_i_1 * p_j_1)
+    b = _plogq(p_ij_10, p_i_1 * p_j_0)
+    c = _plogq(p_ij_01, p_i_0 * p_j_1)
+    d = _plogq(p_ij_00, p_i_0 * p_j_0)
+    return a + b + c + d
+
+
+def _center_and_norm(arr: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    "Centers each column of `arr` and finds the (uncentered) norm of each column."
+    return arr - arr.mean(axis=0), np.linalg.norm(arr, axis=0)
+
+
+def _pos_cor_block(centered: np.ndarray, norms: np.ndarray, cols: slice) -> np.ndarray:
+    "Evaluates the positive correlation between the columns in `cols` and every column."
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cor = (centered[:, cols].T @ centered) / np.outer(norms[cols], norms)
+    # Negative (and undefined) correlations are clamped to zero
+    return np.where(cor > 0, cor, 0.0)
+
+
+def pos_cor_matrix(arr: np.ndarray) -> np.ndarray:
+    """Evaluates the positive correlation between every pair of columns in `arr`. The result is normalized in
+    place (a row of the upper triangle at a time) so that only one docs x docs matrix is ever allocated."""
+    centered, norms = _center_and_norm(arr)
+    cor = centered.T @ centered
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for i in range(len(cor)):
+            row = cor[i, i:]
+            np.divide(row, norms[i] * norms[i:], out=row)
+            # Negative (and undefined) correlations are clamped to zero
+            np.fmax(row, 0.0, out=row)
+            # Mirror the upper triangle so the result is exactly symmetric
+            cor[i:, i] = row
+    return cor
+
+
+def sparse_pos_cor_matrix(
+    arr: np.ndarray, top_k: int | None = None, min_sim: float | None = None, block_size: int = 256
+) -> csr_matrix:
+    """Evaluates the positive correlation between pairs of columns in `arr`, but only keeps the `top_k`
+    neighbours of each column and/or the pairs with a correlation of at least `min_sim`. A pair is kept
+    if it is kept for either of its columns. The diagonal is always kept."""
+    centered, norms = _center_and_norm(arr)
+    n = arr.shape[1]
+    rows, cols, vals = [np.empty(0, np.intp)], [np.empty(0, np.intp)], [np.empty(0)]
+    for start in range(0, n, block_size):
+        block = _pos_cor_block(centered, norms, slice(start, min(start + block_size, n)))
+        block_rows = np.arange(start, start + len(block))
+        keep = block > 0
+        if min_sim is not None:
+            keep &= block >= min_sim
+        if top_k is not None and top_k < n:
+            # Ignore the diagonal when choosing the neighbours
+            ranked = block.copy()
+            ranked[np.arange(len(block)), block_rows] = -np.inf
+            top = np.argpartition(ranked, -top_k, axis=1)[:, -top_k:]
+            in_top = np.zeros_like(keep)
+            np.put_along_axis(in_top, top, True, axis=1)
+            keep &= in_top
+        keep[np.arange(len(block)), block_rows] = True
+        block_ixs, col_ixs = np.nonzero(keep)
+        rows.append(block_rows[block_ixs])
+        cols.append(col_ixs)
+        vals.append(block[block_ixs, col_ixs])
+    mat = coo_matrix(
+        (np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))), shape=(n, n)
+    ).tocsr()
+    return mat.maximum(mat.T).tocsr()
+
+
+def _add(counter: Counter, key, n: int):
+    "Adds `n` to the count of `key`, dropping the key once its count reaches zero."
+    if n == 0:
+        return
+    counter[key] += n
+    if counter[key] == 0:
+        del counter[key]
 
-        # Populate counters for documents (aka names or identifiers) and terms
-        term_counts = Counter(t for t, _ in pair_counts.elements())
-        doc_counts = Counter(d for _, d in pair_counts.elements())
 
+class NameSimilarity:
+    def __init__(
+        self,
+        names: list[str],
+        allow_dup_names: bool = True,
+        lookback: int = 1,
+        top_k: int | None = None,
+        min_sim: float | None = None,
+    ):
+        self.allow_dup_names = allow_dup_names
+        self.lookback = lookback
+        self.top_k = top_k
+        self.min_sim = min_sim
+
+        # The counts are kept up to date (by `update`) so names can be added and removed without starting over:
+        # every term-document pair (aka occurrance), the pairs that are counted (only once each unless
+        # `allow_dup_names`) and the number of counted pairs of each term
+        self.name_counts = Counter()
+        self.occurrence_counts = Counter()
+        self.pair_counts = Counter()
+        self.term_counts = Counter()
+        self._count(Counter(names), 1)
+        self._refresh()
+
+    def update(self, added: Iterable[str] = (), removed: Iterable[str] = ()) -> "NameSimilarity":
+        """Adds and removes names in place. Only the added and removed names are split into terms and only
+        their counts change, but the MI and similarity matrices are recomputed in full from the counts because
+        every I(X_i; Y_j) depends on the total number of pairs. The result is the same as building from the
+        new list of names."""
+        added = Counter(added)
+        removed = Counter(removed)
+        missing = removed - self.name_counts
+        if len(missing) > 0:
+            raise ValueError(f"cannot remove names that are not present: {list(missing)}")
+        if added == removed:
+            return self
+        self._count(removed, -1)
+        self._count(added, 1)
+        self._refresh()
+        return self
+
+    def sync(self, names: list[str]) -> "NameSimilarity":
+        "Updates in place so that this is the same as `NameSimilarity(names, ...)` (see `update`)."
+        target = Counter(names)
+        return self.update((target - self.name_counts).elements(), (self.name_counts - target).elements())
+
+    def _count(self, names: Counter, sign: int):
+        for name, n in names.items():
+            _add(self.name_counts, name, sign * n)
+            for pair in to_occurrences(name, self.lookback):
+                before = self.occurrence_counts[pair]
+                _add(self.occurrence_counts, pair, sign * n)
+                after = self.occurrence_counts[pair]
+                if not self.allow_dup_names:
+                    before, after = min(before, 1), min(after, 1)
+                _add(self.pair_counts, pair, after - before)
+                _add(self.term_counts, pair[0], after - before)
+
+    def _refresh(self):
         # Remove isolated terms from vocabulary
-        isolated_terms = {t for t, c in term_counts.items() if c <= 1}
-        pair_counts = Counter({(t, d): c for (t, d), c in pair_counts.items() if t not in isolated_terms})
-        term_counts = Counter(t for t, _ in pair_counts.elements())
-        doc_counts = Counter(d for _, d in pair_counts.elements())
-
-        # Get total
-        total = pair_counts.total()
-
-        # Define functions for the probabilities and mutual information
-        @cache
-        def p_i_1(term: str) -> float:
-            "Evaluates P(X_i = 1) where i is the term."
-            return term_counts[term] / total
-
-        @cache
-        def p_i_0(term: str) -> float:
-            "Evaluates P(X_i = 0) where i is the term."
-            return (total - term_counts[term]) / total
-
-        @cache
-        def p_j_1(doc: str) -> float:
-            "Evaluates P(Y_j = 1) where j is the document."
-            return doc_counts[doc] / total
-
-        @cache
-        def p_j_0(doc: str) -> float:
-            "Evaluates P(Y_j = 0) where j is the document."
-            return (total - doc_counts[doc]) / total
-
-        @cache
-        def p_ij_11(term: str, doc: str) -> float:
-            "Evaluates P(X_i = 1; Y_j = 1) where i is the term and j is the document."
-            return pair_counts[term, doc] / total
-
-        @cache
-        def p_ij_10(term: str, doc: str) -> float:
-            "Evaluates P(X_i = 1; Y_j = 0) where i is the term and j is the document."
-            return (term_counts[term] - pair_counts[term, doc]) / total
-
-        @cache
-        def p_ij_01(term: str, doc: str) -> float:
-            "Evaluates P(X_i = 0; Y_j = 1) where i is the term and j is the document."
-            return (doc_counts[doc] - pair_counts[term, doc]) / total
-
-        @cache
-        def p_ij_00(term: str, doc: str) -> float:
-            "Evaluates P(X_i = 0; Y_j = 0) where i is the term and j is the document."
-            return (total + pair_counts[term, doc] - term_counts[term] - doc_counts[doc]) / total
-
-        def log(x: float) -> float:
-            return 0.0 if x == 0.0 else math.log(x)
-
-        def mi(term: str, doc: str) -> float:
-            "Evaluates mutual information I(X_i; Y_j) where i is the term and j is the document."
-            a = p_ij_11(term, doc) * log(p_ij_11(term, doc) / (p_i_1(term) * p_j_1(doc)))
-            b = p_ij_10(term, doc) * log(p_ij_10(term, doc) / (p_i_1(term) * p_j_0(doc)))
-            c = p_ij_01(term, doc) * log(p_ij_01(term, doc) / (p_i_0(term) * p_j_1(doc)))
-            d = p_ij_00(term, doc) * log(p_ij_00(term, doc) / (p_i_0(term) * p_j_0(doc)))
-            return a + b + c + d
-
-        # Create ordered sets for the terms and docs to use as the canonical ordering
-        self.terms = oset(term_counts)
-        self.docs = oset(doc_counts)
+        isolated_terms = {t for t, c in self.term_counts.items() if c <= 1}
+        pair_counts = Counter({(t, d): c for (t, d), c in self.pair_counts.items() if t not in isolated_terms})
+
+        # Create ordered sets for the terms and docs to use as the canonical ordering (sorted, so that it
+        # doesn't depend on the order in which names were added)
+        self.terms = oset(sorted({t for t, _ in pair_counts}))
+        self.docs = oset(sorted({d for _, d in pair_counts}))
 
         # Create a rectangular matrix to record I(X_i; Y_j) values
-        arr = np.zeros((len(self.terms), len(self.docs)))
-        for i, term in enumerate(self.terms):
-            for j, doc in enumerate(self.docs):
-                arr[i, j] = mi(term, doc)
+        arr = mi_matrix(*to_count_arrays(pair_counts, self.terms, self.docs))
 
         # Use PCA to reduce dimension (skip-grams will result in many redundant dimensions)
         # arr = PCA(n_components=0.99, svd_solver="full").fit_transform(arr.T).T
         # print(arr.shape)
 
-        # Define positive correlation
-        def center(vec: np.ndarray) -> float:
-            return vec - np.mean(vec)
+        # Create a square matrix to record correlation values (sparse if only the strongest pairs are kept)
+        if self.top_k is None and self.min_sim is None:
+            self.sim_mat = pos_cor_matrix(arr)
+        else:
+            self.sim_mat = sparse_pos_cor_matrix(arr, self.top_k, self.min_sim)
+
+    @property
+    def dist_mat(self) -> np.ndarray | csr_matrix:
+        # A sparse distance matrix only holds the pairs that were kept, which is what DBSCAN expects
+        if issparse(self.sim_mat):
+            dist_mat = self.sim_mat.copy()
+            dist_mat.data = 1 - dist_mat.data
+            return dist_mat
+        return 1 - self.sim_mat
 
-        def norm(vec: np.ndarray) -> float:
-            return np.linalg.norm(vec)
-
-        def pos_cor(a: np.ndarray, b: np.ndarray) -> float: 
-            return max(0, np.dot(center(a), center(b)) / (norm(a) * norm(b)))
-
-        # Create a square matrix to record correlation values
-        self.sim_mat = np.zeros((len(self.docs), len(self.docs)))
-        for i in range(len(self.docs)):
-            for j in range(i, len(self.docs)):
-                self.sim_mat[i, j] = self.sim_mat[j, i] = pos_cor(arr[:, i], arr[:, j])
-        
-        # Create a square dist
-        self.dist_mat = 1 - self.sim_mat
-    
     def has_doc(self, doc: str) -> bool:
         return normalize_name(doc) in self.docs
 
@@ -192,10 +338,59 @@ class NameSimilarity:
             return 0.0
         return self.sim_mat[self.get_doc_ix(a_doc), self.get_doc_ix(b_doc)]
     
+    def get_doc_ixs(self, docs: Iterable[str]) -> np.ndarray:
+        "Like `get_doc_ix` but for many docs at once. Docs that are not present are given an index of -1."
+        normalized = (normalize_name(d) for d in docs)
+        return np.fromiter((self.docs.index(d) if d in self.docs else -1 for d in normalized), dtype=np.intp)
+
+    def group_sim_mat(self, groups: list[list[str]], agg: str = "max") -> np.ndarray:
+        """Finds the max (or "min" or "avg") similarity between the docs of every pair of groups. This is
+        equivalent to aggregating `sim` over every pair of docs that are present. Groups without any docs
+        have a similarity of zero. A sparse `sim_mat` only supports "max" (pairs that were not kept count
+        as zero.)"""
+        reducers = {"max": np.maximum, "min": np.minimum}
+        if agg not in reducers and agg != "avg":
+            raise ValueError(f"unknown aggregation '{agg}'")
+        if issparse(self.sim_mat) and agg != "max":
+            raise ValueError("a sparse similarity matrix only supports the 'max' aggregation")
+
+        # Flatten the groups into one array of doc indices (dropping missing docs) with offsets per group
+        ixs = [self.get_doc_ixs(g) for g in groups]
+        ixs = [g[g >= 0] for g in ixs]
+        present = np.array([len(g) > 0 for g in ixs], dtype=bool)
+        sizes = np.array([len(g) for g in ixs if len(g) > 0], dtype=np.intp)
+        flat = np.concatenate([g for g in ixs if len(g) > 0] + [np.empty(0, np.intp)])
+        starts = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.intp)
+
+        res = np.zeros((len(groups), len(groups)))
+        if len(sizes) == 0:
+            return res
+        if agg == "avg":
+            # Sum the similarity between every pair of groups with the help of a group-by-doc count matrix
+            counts = coo_matrix(
+                (np.ones(len(flat)), (np.repeat(np.arange(len(sizes)), sizes), flat)),
+                shape=(len(sizes), len(self.docs)),
+            ).tocsr()
+            sums = counts @ (counts @ self.sim_mat).T
+            inner = sums / np.outer(sizes, sizes)
+        elif issparse(self.sim_mat):
+            # Reduce over the rows of each group, then reduce over the columns of each group
+            by_row = vstack([self.sim_mat[flat[a : a + n]].max(axis=0) for a, n in zip(starts, sizes)])
+            by_col = by_row.T.tocsr()
+            inner = vstack([by_col[flat[a : a + n]].max(axis=0) for a, n in zip(starts, sizes)]).T.toarray()
+        else:
+            # Reduce over the rows of each group, then reduce over the columns of each group
+            reducer = reducers[agg]
+            by_row = reducer.reduceat(self.sim_mat[flat], starts, axis=0)
+            inner = reducer.reduceat(by_row[:, flat], starts, axis=1)
+        res[np.ix_(present, present)] = inner
+        return res
+
     def most_sim(self, doc: str, n: int) -> list[tuple[str, float]]:
         doc_ix = self.get_doc_ix(doc)
-        most_sim_indices = reversed(np.argsort(self.sim_mat[doc_ix])[-n:-1])
-        return [(self.docs[ix], self.sim_mat[doc_ix, ix]) for ix in most_sim_indices]
+        row = self.sim_mat[doc_ix].toarray().ravel() if issparse(self.sim_mat) else self.sim_mat[doc_ix]
+        most_sim_indices = reversed(np.argsort(row)[-n:-1])
+        return [(self.docs[ix], row[ix]) for ix in most_sim_indices]
     
     # def dist(self, a_doc: str, b_doc: str) -> float:
     #     return self.dist_mat[self.get_doc_ix(a_doc), self.get_doc_ix(b_doc)]
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import sqlite3
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Mapping
+
+from filesplitter import ilp
+
+
+@dataclass
+class PartitionCacheInfo:
+    hits: int
+    misses: int
+    entries: int
+    size: int
+    max_size: int
+
+
+def _to_json(obj) -> str:
+    # NumPy scalars are converted to plain numbers
+    return json.dumps(obj, separators=(",", ":"), default=lambda o: o.item())
+
+
+def subproblem_key(
+    partitioner: str,
+    di_edges: set[tuple[int, int]],
+    un_edges: set[tuple[int, int]],
+    node_weight: Callable[[int], int] | Mapping[int, int],
+    edge_weight: Callable[[int, int], int] | Mapping[tuple[int, int], int],
+    k: int,
+    eps: float,
+    max_time_in_seconds: float | None,
+    params: ilp.SolverParams | None = None,
+) -> str:
+    "Hashes everything that determines the solution of a partitioning problem (in a canonical order)."
+    # Logging doesn't change the solution, but every other solver setting can
+    params = {n: v for n, v in asdict(params or ilp.SolverParams()).items() if n != "log_search_progress"}
+    node_weight, edge_weight = ilp.as_weight_fns(node_weight, edge_weight)
+    nodes = sorted({a for a, _ in di_edges | un_edges} | {b for _, b in di_edges | un_edges})
+    problem = {
+        "partitioner": partitioner,
+        "k": k,
+        "eps": eps,
+        "max_time": max_time_in_seconds,
+        "params": params,
+        "nodes": [(i, node_weight(i)) for i in nodes],
+        "di_edges": [(a, b, edge_weight(a, b)) for a, b in sorted(di_edges)],
+        "un_edges": [(a, b, edge_weight(a, b)) for a, b in sorted(un_edges)],
+    }
+    return hashlib.sha256(_to_json(problem).encode()).hexdigest()
+
+
+class PartitionCache:
+    """Stores the solutions of partitioning problems in a SQLite file under the key of each problem (see
+    `subproblem_key`). Once the stored solutions take up more than `max_size` bytes, the least recently used
+    ones are evicted."""
+
+    def __init__(self, path: str, max_size: int = 2**28):
+        self.path = path
+        self.max_size = max_size
+        self._hits = 0
+        self._misses = 0
+        self._con = sqlite3.connect(path, timeout=60)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS solutions (
+                key TEXT PRIMARY KEY,
+                cut_weight REAL NOT NULL,
+                status TEXT NOT NULL,
+                labels TEXT,
+                size INTEGER NOT NULL,
+                used_at REAL NOT NULL
+            )
+            """
+        )
+        self._con.execute("CREATE INDEX IF NOT EXISTS solutions_used_at ON solutions (used_at)")
+
+        # Keep a running total of the sizes (shared by every process) so that `put` doesn't add them up
+        self._con.execute("CREATE TABLE IF NOT EXISTS total (id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER)")
+        self._con.execute("INSERT OR IGNORE INTO total SELECT 0, TOTAL(size) FROM solutions")
+        self._con.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS solutions_insert AFTER INSERT ON solutions
+            BEGIN UPDATE total SET size = size + NEW.size; END
+            """
+        )
+        self._con.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS solutions_delete AFTER DELETE ON solutions
+            BEGIN UPDATE total SET size = size - OLD.size; END
+            """
+        )
+        self._con.commit()
+
+    def get(self, key: str) -> tuple[float, dict[int, int] | None, str] | None:
+        "Returns the cut weight, labels and solver status stored under the key (if any)."
+        row = self._con.execute("SELECT cut_weight, status, labels FROM solutions WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        with self._con:
+            self._con.execute("UPDATE solutions SET used_at = ? WHERE key = ?", (time.time(), key))
+        cut_weight, status, labels = row
+        labels = None if labels is None else {int(i): l for i, l in json.loads(labels).items()}
+        return cut_weight, labels, status
+
+    def put(self, key: str, cut_weight: float, labels: dict[int, int] | None, status: str):
+        labels = None if labels is None else _to_json({int(i): l for i, l in labels.items()})
+        size = len(key) + len(status) + (0 if labels is None else len(labels)) + 16
+        with self._con:
+            # Not INSERT OR REPLACE, which would skip the delete trigger
+            self._con.execute("DELETE FROM solutions WHERE key = ?", (key,))
+            self._con.execute(
+                "INSERT INTO solutions VALUES (?, ?, ?, ?, ?, ?)",
+                (key, cut_weight, status, labels, size, time.time()),
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self._con.execute("SELECT size FROM total").fetchone()[0]
+        if total <= self.max_size:
+            return
+        # Walk from least to most recently used until enough has been freed
+        excess = total - self.max_size
+        for key, size in self._con.execute("SELECT key, size FROM solutions ORDER BY used_at").fetchall():
+            self._con.execute("DELETE FROM solutions WHERE key = ?", (key,))
+            excess -= size
+            if excess <= 0:
+                break
+
+    def close(self):
+        self._con.close()
+
+    def cache_clear(self):
+        with self._con:
+            self._con.execute("DELETE FROM solutions")
+        self._hits = self._misses = 0
+
+    def cache_info(self) -> PartitionCacheInfo:
+        entries, size = self._con.execute("SELECT COUNT(*), TOTAL(size) FROM solutions").fetchone()
+        return PartitionCacheInfo(self._hits, self._misses, entries, int(size), self.max_size)
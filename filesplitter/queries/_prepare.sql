@@ -0,0 +1,53 @@
+DROP TABLE IF EXISTS {schema}.fs_meta;
+DROP TABLE IF EXISTS {schema}.fs_ancestors;
+DROP TABLE IF EXISTS {schema}.fs_filenames;
+DROP TABLE IF EXISTS {schema}.fs_levels;
+
+CREATE TABLE {schema}.fs_ancestors AS
+WITH RECURSIVE ancestors (entity_id, ancestor_id) AS
+(
+    SELECT E.id AS entity_id, E.id AS ancestor_id
+    FROM main.entities E
+
+    UNION ALL
+
+    SELECT E.id AS entity_id, A.ancestor_id
+    FROM ancestors A
+    JOIN main.entities E ON A.entity_id = E.parent_id
+)
+SELECT * FROM ancestors;
+
+CREATE INDEX {schema}.fs_ancestors_entity_id ON fs_ancestors (entity_id, ancestor_id);
+CREATE INDEX {schema}.fs_ancestors_ancestor_id ON fs_ancestors (ancestor_id, entity_id);
+
+CREATE TABLE {schema}.fs_filenames AS
+SELECT E.id AS entity_id, FE.id AS file_id, FE.name AS filename
+FROM main.entities E
+JOIN {schema}.fs_ancestors A ON A.entity_id = E.id
+JOIN main.entities FE ON FE.id = A.ancestor_id
+WHERE FE.parent_id IS NULL;
+
+CREATE INDEX {schema}.fs_filenames_entity_id ON fs_filenames (entity_id, file_id, filename);
+CREATE INDEX {schema}.fs_filenames_filename ON fs_filenames (filename, entity_id);
+
+CREATE TABLE {schema}.fs_levels AS
+WITH RECURSIVE levels (entity_id, level) AS
+(
+    SELECT E.id AS entity_id, 0 as level
+    FROM main.entities E
+    WHERE E.parent_id IS NULL
+
+    UNION ALL
+
+    SELECT E.id AS entity_id, L.level + 1
+    FROM main.entities E, levels L
+    WHERE E.parent_id = L.entity_id
+)
+SELECT * FROM levels;
+
+CREATE INDEX {schema}.fs_levels_entity_id ON fs_levels (entity_id, level);
+
+CREATE TABLE {schema}.fs_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+
+-- Without statistics on the new tables the planner picks much worse join orders for fetch_clients
+ANALYZE {schema};
@@ -0,0 +1,37 @@
+CREATE TEMP TABLE temp.filenames AS
+WITH RECURSIVE subtree (id) AS
+(
+    SELECT :file_id AS id
+
+    UNION
+
+    SELECT E.id
+    FROM subtree S
+    JOIN entities E ON E.parent_id = S.id
+),
+scope (id) AS
+(
+    SELECT id FROM subtree
+
+    UNION
+
+    SELECT D.src_id AS id
+    FROM deps D
+    WHERE D.tgt_id IN (SELECT id FROM subtree)
+),
+ancestors (entity_id, ancestor_id, parent_id) AS
+(
+    SELECT E.id AS entity_id, E.id AS ancestor_id, E.parent_id
+    FROM scope S
+    JOIN entities E ON E.id = S.id
+
+    UNION ALL
+
+    SELECT A.entity_id, E.id AS ancestor_id, E.parent_id
+    FROM ancestors A
+    JOIN entities E ON E.id = A.parent_id
+)
+SELECT A.entity_id, FE.id AS file_id, FE.name AS filename
+FROM ancestors A
+JOIN entities FE ON FE.id = A.ancestor_id
+WHERE A.parent_id IS NULL;
@@ -0,0 +1,56 @@
+CREATE TABLE IF NOT EXISTS {schema}.fs_churn (file_id INTEGER PRIMARY KEY, adds INTEGER, dels INTEGER);
+CREATE TABLE IF NOT EXISTS {schema}.fs_churn_authors (
+    file_id INTEGER NOT NULL,
+    author_email TEXT NOT NULL,
+    PRIMARY KEY (file_id, author_email)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS {schema}.fs_churn_committers (
+    file_id INTEGER NOT NULL,
+    committer_email TEXT NOT NULL,
+    PRIMARY KEY (file_id, committer_email)
+) WITHOUT ROWID;
+-- Changes of commits up to (and including) the high-water mark have already been folded in
+CREATE TABLE IF NOT EXISTS {schema}.fs_churn_state (high_water INTEGER NOT NULL);
+
+BEGIN;
+
+INSERT INTO {schema}.fs_churn_state
+SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM {schema}.fs_churn_state);
+
+CREATE TEMP TABLE temp.new_changes AS
+SELECT F.file_id, CO.author_email, CO.committer_email, CH.adds, CH.dels
+FROM changes CH
+JOIN temp.filenames F ON F.entity_id = CH.entity_id
+JOIN commits CO ON CO.id = CH.commit_id
+WHERE
+    CH.commit_id > (SELECT high_water FROM {schema}.fs_churn_state) AND
+    CH.commit_id <= (SELECT MAX(id) FROM commits);
+
+-- COALESCE keeps the meaning of SUM, which ignores NULLs (unless everything is NULL)
+INSERT INTO {schema}.fs_churn (file_id, adds, dels)
+SELECT file_id, SUM(adds), SUM(dels)
+FROM temp.new_changes
+WHERE true
+GROUP BY file_id
+ON CONFLICT (file_id) DO UPDATE SET
+    adds = COALESCE(adds + excluded.adds, adds, excluded.adds),
+    dels = COALESCE(dels + excluded.dels, dels, excluded.dels);
+
+INSERT OR IGNORE INTO {schema}.fs_churn_authors
+SELECT DISTINCT file_id, author_email FROM temp.new_changes WHERE author_email IS NOT NULL;
+
+INSERT OR IGNORE INTO {schema}.fs_churn_committers
+SELECT DISTINCT file_id, committer_email FROM temp.new_changes WHERE committer_email IS NOT NULL;
+
+UPDATE {schema}.fs_churn_state
+SET high_water = MAX(high_water, COALESCE((SELECT MAX(id) FROM commits), 0));
+
+DROP TABLE temp.new_changes;
+
+COMMIT;
+
+CREATE TEMP VIEW IF NOT EXISTS temp.churn AS SELECT * FROM {schema}.fs_churn;
+
+CREATE TEMP VIEW IF NOT EXISTS temp.churn_authors AS SELECT * FROM {schema}.fs_churn_authors;
+
+CREATE TEMP VIEW IF NOT EXISTS temp.churn_committers AS SELECT * FROM {schema}.fs_churn_committers;
@@ -0,0 +1,5 @@
+CREATE TEMP VIEW IF NOT EXISTS temp.ancestors AS SELECT * FROM {schema}.fs_ancestors;
+
+CREATE TEMP VIEW IF NOT EXISTS temp.filenames AS SELECT * FROM {schema}.fs_filenames;
+
+CREATE TEMP VIEW IF NOT EXISTS temp.levels AS SELECT * FROM {schema}.fs_levels;
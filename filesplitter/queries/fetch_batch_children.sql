@@ -0,0 +1,7 @@
+SELECT T.top_id AS target_id, E.id, E.parent_id, E.name, E.kind, P.start_row, P.end_row
+FROM temp.batch_targets T
+JOIN entities E ON E.parent_id = T.top_id
+JOIN presence P ON P.entity_id = E.id
+JOIN refs R ON R.commit_id = P.commit_id
+WHERE R.name = :ref_name
+ORDER BY T.top_id, P.start_row, E.name, E.id
@@ -0,0 +1,6 @@
+SELECT T.top_id AS target_id, SF.file_id AS src_id, D.tgt_id, D.kind
+FROM temp.batch_targets T
+JOIN entities TE ON TE.parent_id = T.top_id
+JOIN deps D ON D.tgt_id = TE.id
+JOIN temp.filenames SF ON SF.entity_id = D.src_id
+WHERE SF.filename <> T.filename
@@ -0,0 +1,7 @@
+SELECT DISTINCT T.top_id AS target_id, SFE.id, SFE.parent_id, SFE.name, SFE.kind
+FROM temp.batch_targets T
+JOIN temp.filenames TF  ON TF.filename = T.filename
+JOIN deps D             ON D.tgt_id = TF.entity_id
+JOIN temp.filenames SF  ON SF.entity_id = D.src_id
+JOIN entities       SFE ON SFE.id = SF.file_id
+WHERE SF.filename <> TF.filename
@@ -0,0 +1,4 @@
+SELECT T.filename, E.id
+FROM temp.batch_targets T
+JOIN entities E ON E.name = T.filename
+WHERE E.kind = 'file'
@@ -0,0 +1,8 @@
+SELECT T.top_id AS target_id, D.src_id, D.tgt_id, D.kind
+FROM temp.batch_targets T
+JOIN entities SE ON SE.parent_id = T.top_id
+JOIN deps D ON D.src_id = SE.id
+JOIN entities TE ON TE.id = D.tgt_id
+WHERE
+    TE.parent_id = T.top_id AND
+    D.src_id <> D.tgt_id
@@ -0,0 +1,11 @@
+SELECT DISTINCT T.top_id AS target_id, TE.name
+FROM temp.batch_targets T
+JOIN entities SE ON SE.parent_id = T.top_id
+JOIN deps D ON D.src_id = SE.id
+JOIN entities TE ON TE.id = D.tgt_id
+WHERE
+    TE.kind = 'class' OR
+    TE.kind = 'interface' OR
+    TE.kind = 'enum' OR
+    TE.kind = 'annotation'
+ORDER BY T.top_id, TE.name
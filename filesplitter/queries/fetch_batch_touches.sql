@@ -0,0 +1,9 @@
+SELECT T.top_id AS target_id, CO.sha1, CO.author_email, CH.entity_id, CH.adds, CH.dels
+FROM temp.batch_targets T
+JOIN entities E ON E.parent_id = T.top_id
+JOIN changes CH ON CH.entity_id = E.id
+JOIN presence P ON P.entity_id = CH.entity_id
+JOIN refs R ON R.commit_id = P.commit_id
+JOIN commits CO ON CO.id = CH.commit_id
+WHERE R.name = :ref_name
+ORDER BY T.top_id, CO.author_email, CO.committer_date, E.id
@@ -79,4 +79,4 @@ AND locs.filename NOT LIKE '%/test/%'
 AND locs.filename NOT LIKE '%/tests/%'
 AND locs.filename NOT LIKE '%test/%'
 AND locs.filename NOT LIKE '%tests/%'
-ORDER BY (member_counts.member_count + fan_ins.fan_in) DESC
\ No newline at end of file
+ORDER BY (member_counts.member_count + fan_ins.fan_in) DESC, locs.filename
\ No newline at end of file
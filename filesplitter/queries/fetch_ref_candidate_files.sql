@@ -0,0 +1,83 @@
+WITH ref_commits AS
+(
+    SELECT commit_id FROM refs WHERE name = :ref_name
+),
+locs AS
+(
+    SELECT
+        P.commit_id,
+        P.entity_id,
+        F.file_id,
+        E.name,
+        F.filename,
+        E.kind,
+        P.end_row - P.start_row AS loc
+    FROM presence P
+    JOIN filenames F ON F.entity_id = P.entity_id
+    JOIN levels L ON L.entity_id = P.entity_id
+    JOIN entities E ON E.id = P.entity_id
+    WHERE L.level = 1 AND P.commit_id IN (SELECT commit_id FROM ref_commits)
+    GROUP BY P.commit_id, P.entity_id
+),
+member_counts AS
+(
+    SELECT
+        P.commit_id,
+        E.parent_id AS entity_id,
+        COUNT(DISTINCT P.entity_id) AS member_count
+    FROM presence P
+    JOIN levels L ON L.entity_id = P.entity_id
+    JOIN entities E ON E.id = P.entity_id
+    WHERE L.level = 2 AND P.commit_id IN (SELECT commit_id FROM ref_commits)
+    GROUP BY P.commit_id, E.parent_id
+),
+fan_ins AS
+(
+    SELECT
+        D.commit_id,
+        TF.file_id,
+        COUNT(DISTINCT SF.file_id) AS fan_in
+    FROM deps D
+    JOIN filenames SF ON SF.entity_id = D.src_id
+    JOIN filenames TF ON TF.entity_id = D.tgt_id
+    WHERE SF.file_id <> TF.file_id AND D.commit_id IN (SELECT commit_id FROM ref_commits)
+    GROUP BY D.commit_id, TF.file_id
+),
+user_counts AS
+(
+    SELECT
+        C.file_id,
+        (SELECT COUNT(*) FROM temp.churn_authors A WHERE A.file_id = C.file_id) AS author_count,
+        (SELECT COUNT(*) FROM temp.churn_committers M WHERE M.file_id = C.file_id) AS committer_count,
+        C.adds,
+        C.dels,
+        C.adds + C.dels AS churn
+    FROM temp.churn C
+)
+SELECT
+    refs.name AS ref_name,
+    DATE(commits.committer_date, 'unixepoch') AS ref_date,
+    locs.filename,
+    locs.kind,
+    locs.loc,
+    member_counts.member_count,
+    fan_ins.fan_in,
+    user_counts.author_count,
+    user_counts.committer_count,
+    user_counts.adds,
+    user_counts.dels,
+    user_counts.churn
+FROM locs
+JOIN member_counts ON member_counts.commit_id = locs.commit_id AND member_counts.entity_id = locs.entity_id
+JOIN fan_ins ON fan_ins.commit_id = locs.commit_id AND fan_ins.file_id = locs.file_id
+JOIN user_counts ON user_counts.file_id = locs.file_id
+JOIN refs ON refs.commit_id = locs.commit_id
+JOIN commits ON commits.id = locs.commit_id
+WHERE refs.name = :ref_name
+AND locs.loc >= :min_locs
+AND user_counts.author_count >= :min_authors
+AND locs.filename NOT LIKE '%/test/%'
+AND locs.filename NOT LIKE '%/tests/%'
+AND locs.filename NOT LIKE '%test/%'
+AND locs.filename NOT LIKE '%tests/%'
+ORDER BY (member_counts.member_count + fan_ins.fan_in) DESC, locs.filename
\ No newline at end of file
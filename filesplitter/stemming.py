@@ -0,0 +1,100 @@
+import sqlite3
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import nltk
+
+
+@dataclass
+class StemCacheInfo:
+    hits: int
+    disk_hits: int
+    misses: int
+    size: int
+    maxsize: int
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.disk_hits + self.misses
+        return (self.hits + self.disk_hits) / lookups if lookups > 0 else 0.0
+
+
+class StemCache:
+    """Memoizes the Porter stem of individual tokens.
+
+    Stems are kept in a size-bounded LRU. If a `path` is given, stems are also stored in a SQLite file so
+    that other processes (and later runs) can reuse them. New stems are written in batches, so call
+    `flush()` (or `close()`) to make them visible to other processes.
+    """
+
+    def __init__(self, maxsize: int = 2**16, path: str | None = None, batch_size: int = 1024):
+        self.maxsize = maxsize
+        self.path = path
+        self.batch_size = batch_size
+        self._stemmer = nltk.stem.PorterStemmer()
+        self._stems: OrderedDict[str, str] = OrderedDict()
+        self._pending: dict[str, str] = {}
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._con = None
+        if path is not None:
+            self._con = sqlite3.connect(path, timeout=60)
+            self._con.execute("PRAGMA journal_mode=WAL")
+            self._con.execute(
+                "CREATE TABLE IF NOT EXISTS stems (token TEXT PRIMARY KEY, stem TEXT NOT NULL) WITHOUT ROWID"
+            )
+            self._con.commit()
+
+    def stem(self, token: str) -> str:
+        stem = self._stems.get(token)
+        if stem is not None:
+            self._stems.move_to_end(token)
+            self._hits += 1
+            return stem
+        stem = self._load(token)
+        if stem is not None:
+            self._disk_hits += 1
+        else:
+            stem = self._stemmer.stem(token)
+            self._misses += 1
+            self._store(token, stem)
+        self._stems[token] = stem
+        if len(self._stems) > self.maxsize:
+            self._stems.popitem(last=False)
+        return stem
+
+    def _load(self, token: str) -> str | None:
+        if self._con is None:
+            return None
+        if token in self._pending:
+            return self._pending[token]
+        row = self._con.execute("SELECT stem FROM stems WHERE token = ?", (token,)).fetchone()
+        return None if row is None else row[0]
+
+    def _store(self, token: str, stem: str):
+        if self._con is None:
+            return
+        self._pending[token] = stem
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._con is None or len(self._pending) == 0:
+            return
+        with self._con:
+            self._con.executemany("INSERT OR IGNORE INTO stems VALUES (?, ?)", self._pending.items())
+        self._pending.clear()
+
+    def close(self):
+        self.flush()
+        if self._con is not None:
+            self._con.close()
+            self._con = None
+
+    def cache_clear(self):
+        self._stems.clear()
+        self._hits = self._disk_hits = self._misses = 0
+
+    def cache_info(self) -> StemCacheInfo:
+        return StemCacheInfo(self._hits, self._disk_hits, self._misses, len(self._stems), self.maxsize)
@@ -5,9 +5,13 @@ from random import shuffle
 import numpy as np
 import pandas as pd
 
+from filesplitter import clustering, db, naming
 from filesplitter.dv8 import write_dsm, write_drh
 from filesplitter.clustering import cluster_dataset
-from filesplitter.loading import load_dataset
+from filesplitter.dataset_cache import DatasetCache
+from filesplitter.loading import load_datasets, use_dataset_cache
+from filesplitter.partition_cache import PartitionCache
+from filesplitter.stemming import StemCache
 
 
 def count_blocks_touched(partition: dict[int, int], user_touches: set[int]) -> int:
@@ -91,39 +95,85 @@ def calc_abpc(
     return (real, np.average(trials))
 
 
-def validate_subjects(subjects: pd.DataFrame, data_dir: str, results_dir: str):
+def validate_subjects(
+    subjects: pd.DataFrame,
+    data_dir: str,
+    results_dir: str,
+    stem_cache_path: str | None = None,
+    partition_cache_path: str | None = None,
+    prepared: bool = False,
+    dataset_cache_path: str | None = None,
+):
     if os.path.exists(results_dir):
         raise RuntimeError("the results dir '{}' already exists".format(results_dir))
     os.makedirs(results_dir)
 
-    n_blocks = []
-    real_ABPAs = []
-    null_ABPAs = []
-    real_ABPCs = []
-    null_ABPCs = []
-
-    for i, (_, row) in enumerate(subjects.iterrows()):
-        subject_name = row["subject_name"]
-        print("Working on Subject {}: {}".format(i, subject_name))
-        ds = load_dataset(os.path.join(data_dir, row["project"] + ".db"), row["filename"])
-        entities_df = cluster_dataset(ds)
-        entities_df.to_csv(os.path.join(results_dir, "{}.csv".format(subject_name)))
-        n_blocks.append(entities_df.groupby("block_name").ngroups)
+    # Stems can be shared with other runs (and other processes) through a SQLite file
+    stem_cache = None
+    if stem_cache_path is not None:
+        stem_cache = StemCache(path=stem_cache_path)
+        prev_stem_cache = naming.use_stem_cache(stem_cache)
+
+    # Bisections that were already solved (e.g. in an earlier sweep) are looked up in a SQLite file
+    partition_cache = None
+    if partition_cache_path is not None:
+        partition_cache = PartitionCache(partition_cache_path)
+        prev_partition_cache = clustering.use_partition_cache(partition_cache)
+
+    # Datasets loaded by earlier runs are read back from a directory (until their database changes)
+    dataset_cache = None
+    if dataset_cache_path is not None:
+        dataset_cache = DatasetCache(dataset_cache_path)
+        prev_dataset_cache = use_dataset_cache(dataset_cache)
+
+    n_blocks = [0] * len(subjects)
+    real_ABPAs = [0.0] * len(subjects)
+    null_ABPAs = [0.0] * len(subjects)
+    real_ABPCs = [0.0] * len(subjects)
+    null_ABPCs = [0.0] * len(subjects)
+
+    try:
+        # Subjects are loaded (and so worked on) one database at a time
+        pairs = [
+            (os.path.join(data_dir, row["project"] + ".db"), row["filename"]) for _, row in subjects.iterrows()
+        ]
+        for i, ds in load_datasets(pairs, prepared):
+            subject_name = subjects.iloc[i]["subject_name"]
+            print("Working on Subject {}: {}".format(i, subject_name))
+            entities_df = cluster_dataset(ds)
+            entities_df.to_csv(os.path.join(results_dir, "{}.csv".format(subject_name)))
+            n_blocks[i] = entities_df.groupby("block_name").ngroups
         
-        # Dump DV8 Data
-        targets_df = entities_df.loc[~(entities_df["kind"] == "file")]
-        dsm_path = os.path.join(results_dir, "{}.dsm.json".format(subject_name))
-        write_dsm(dsm_path, subject_name, targets_df, ds.target_deps_df)
-        drh_path = os.path.join(results_dir, "{}.drh.json".format(subject_name))
-        write_drh(drh_path, subject_name + "-drh", targets_df)
-
-        # Validate
-        real_ABPA, null_ABPA = calc_abpa(entities_df, ds.touches_df)
-        real_ABPAs.append(real_ABPA)
-        null_ABPAs.append(null_ABPA)
-        real_ABPC, null_ABPC = calc_abpc(entities_df, ds.touches_df)
-        real_ABPCs.append(real_ABPC)
-        null_ABPCs.append(null_ABPC)
+            # Dump DV8 Data
+            targets_df = entities_df.loc[~(entities_df["kind"] == "file")]
+            dsm_path = os.path.join(results_dir, "{}.dsm.json".format(subject_name))
+            write_dsm(dsm_path, subject_name, targets_df, ds.target_deps_df)
+            drh_path = os.path.join(results_dir, "{}.drh.json".format(subject_name))
+            write_drh(drh_path, subject_name + "-drh", targets_df)
+
+            # Validate
+            real_ABPAs[i], null_ABPAs[i] = calc_abpa(entities_df, ds.touches_df)
+            real_ABPCs[i], null_ABPCs[i] = calc_abpc(entities_df, ds.touches_df)
+
+            print(naming.format_cache_info())
+            if partition_cache is not None:
+                print(partition_cache.cache_info())
+            if dataset_cache is not None:
+                print(dataset_cache.cache_info())
+            naming.flush_stem_cache()
+
+        # Where the time in the database went (over all subjects)
+        print(db.query_stats())
+    finally:
+        # Put back the caches that were in use before this run (and close the ones it opened)
+        if stem_cache is not None:
+            naming.use_stem_cache(prev_stem_cache)
+            stem_cache.close()
+        if partition_cache is not None:
+            clustering.use_partition_cache(prev_partition_cache)
+            partition_cache.close()
+        if dataset_cache is not None:
+            use_dataset_cache(prev_dataset_cache)
 
     subjects["n_blocks"] = n_blocks
 
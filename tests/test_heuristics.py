@@ -0,0 +1,16 @@
+import pytest
+
+from filesplitter import heuristics
+
+
+@pytest.mark.parametrize("name", ["spectral", "hybrid"])
+@pytest.mark.parametrize(
+    "di_edges",
+    [set(), {(1, 1)}, {(1, 2), (2, 3), (3, 1)}],
+    ids=["no_edges", "self_loop", "one_cycle"],
+)
+def test_fewer_than_two_components(name, di_edges):
+    "Graphs that contract to fewer than two components can't be split, but must not raise."
+    cut_weight, labels, _ = heuristics.PARTITIONERS[name](di_edges, set(), lambda n: 1, lambda a, b: 1, 2, 0.5)
+    assert cut_weight == 0
+    assert len(set(labels.values())) <= 1